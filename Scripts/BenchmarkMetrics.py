@@ -0,0 +1,245 @@
+'''
+Benchmark loading and plotting of the MIRA metrics datasets.
+
+The loaders are timed over representative slices of MetricsData (small and
+large resolutions, plain and bz2 compressed CSV files, uniformly and regionally
+refined cases) for each of the storage/caching strategies of MIRADatasets, and
+plot_dataset is timed with and without image export. The results (throughput,
+latency percentiles and peak memory) are written as JSON so that runs can be
+compared offline.
+
+Usage:
+python BenchmarkMetrics.py [--strategies files decompressed store memory compact] [--output bench.json]
+'''
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+import MIRADatasets
+from MIRAProfiling import latency_summary, add_stage_listener, remove_stage_listener
+
+# Representative slices of the archive: (iMETHOD, subPath, Order, resolutions, isRRM).
+# TempestRemap datasets are plain CSV files while GMLS datasets are bz2 compressed.
+BENCHMARK_SLICES = {
+    'uniform-small-csv': (0, -1, 4, [(0, 0), (0, 1), (1, 0), (1, 1)], False),
+    'uniform-large-csv': (0, -1, 4, [(3, 3), (3, 4), (4, 3), (4, 4)], False),
+    'uniform-small-bz2': (1, 0, 4, [(0, 0), (0, 1), (1, 0), (1, 1)], False),
+    'uniform-large-bz2': (1, 0, 4, [(3, 3), (3, 4), (4, 3), (4, 4)], False),
+    'rrm-csv': (0, -1, 4, [(0, 0), (1, 1), (2, 2), (0, 2), (2, 0)], True),
+}
+
+# Loader configurations to compare: (use store, use decompressed cache, frame cache entries,
+# compact archive encoding)
+BENCHMARK_STRATEGIES = {
+    'files': (False, False, 0, None),
+    'decompressed': (False, True, 0, None),
+    'store': (True, False, 0, None),
+    'memory': (False, False, MIRADatasets.FRAME_CACHE_ENTRIES, None),
+    'compact': (True, False, 0, 'delta'),
+}
+
+# Compact archives built for the strategies, by encoding, kept aside while other
+# strategies run so that each is built once per benchmark
+_compactArchives = {}
+
+
+def configure_strategy(strategy):
+    '''
+    Configure the MIRADatasets loaders for one of the BENCHMARK_STRATEGIES
+    '''
+    usestore, usedecompressed, cacheentries, encoding = BENCHMARK_STRATEGIES[strategy]
+    MIRADatasets.USE_METRICS_STORE = usestore
+    MIRADatasets.USE_DECOMPRESSED_CACHE = usedecompressed
+    MIRADatasets.configure_frame_cache(maxentries=cacheentries)
+    if encoding is not None and encoding not in _compactArchives:
+        _compactArchives[encoding] = MIRADatasets.configure_compact_archive(encoding)
+    MIRADatasets.set_compact_archive(_compactArchives.get(encoding))
+
+
+def get_slice_cases(slicename):
+    '''
+    Return the loader arguments of all cases in a benchmark slice
+    '''
+    iMETHOD, subPath, Order, resolutions, isRRM = BENCHMARK_SLICES[slicename]
+    cases = []
+    for ivar in range(len(MIRADatasets.DATAVARIABLES)):
+        for isrc, itgt in resolutions:
+            cases.append((iMETHOD, 0, isrc, itgt, ivar, Order, subPath))
+    return cases, isRRM
+
+
+def load_case(case, isRRM):
+    iMETHOD, GridType, isrc, itgt, ivar, Order, subPath = case
+    if isRRM:
+        return MIRADatasets.get_rrm_dataset(iMETHOD, isrc, itgt, ivar, Order, subPath)
+    return MIRADatasets.get_dataset(iMETHOD, GridType, isrc, itgt, ivar, Order, subPath)
+
+
+def benchmark_loader(slicename, strategy, repeat=3):
+    '''
+    Time the loaders over one slice for one strategy. Every strategy is warmed
+    up with one untimed pass (which fills the caches it relies on); the peak
+    memory is measured with tracemalloc in a separate pass.
+
+    Returns:
+    dict: Throughput, latency percentiles and peak memory of the loads
+
+    '''
+    configure_strategy(strategy)
+    if strategy == 'store' and MIRADatasets.get_metrics_store() is None:
+        return {'skipped': 'metrics store not built'}
+
+    cases, isRRM = get_slice_cases(slicename)
+    found, missing = [], []
+    nbytes = 0
+    for case in cases:
+        data, filename = load_case(case, isRRM)
+        if data is None:
+            missing.append(list(case))
+            continue
+        found.append(case)
+        nbytes += os.path.getsize(filename)
+    if not found:
+        return {'skipped': 'no datasets found', 'missing_cases': missing}
+    cases = found
+
+    latencies = []
+    start = time.perf_counter()
+    for irepeat in range(repeat):
+        for case in cases:
+            tcase = time.perf_counter()
+            load_case(case, isRRM)
+            latencies.append(time.perf_counter() - tcase)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for case in cases:
+        load_case(case, isRRM)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'cases': len(cases) * repeat,
+            'seconds': elapsed,
+            'cases_per_second': len(cases) * repeat / elapsed,
+            'megabytes_per_second': nbytes * repeat / elapsed / 1024**2,
+            'source_megabytes': nbytes / 1024**2,
+            'latency': latency_summary(latencies),
+            'peak_traced_megabytes': peak / 1024**2,
+            'missing_cases': missing}
+
+
+def benchmark_plot(export, repeat=1):
+    '''
+    Time plot_dataset for a few figures, optionally exporting the images to a
+    temporary directory with export_figures. The construction of each figure
+    is timed through its 'figure' stage and each image is exported on its own,
+    so the latencies are those of the individual figures.
+
+    Returns:
+    dict: Figures per second, latency per figure (construction and export) and peak memory
+
+    '''
+    import ROOComparison
+
+    configure_strategy('memory')
+    kwargs = dict(ivar=4, metricnames=['GC', 'GL2'], resolutions=[(0, 4), (4, 4)],
+                  gridtypes=[0], orders=[4, 4, 4, 2])
+    construction, exports = [], []
+
+    def listener(name, seconds, nbytes):
+        if name == 'figure':
+            construction.append(seconds)
+
+    elapsed = 0.0
+    nfigures = 0
+    add_stage_listener(listener)
+    tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory() as imagepath:
+            for irepeat in range(repeat):
+                figures = []
+                start = time.perf_counter()
+                ROOComparison.plot_dataset(baseImagepath=imagepath, figures=figures, **kwargs)
+                if export:
+                    for figure in figures:
+                        tfigure = time.perf_counter()
+                        try:
+                            ROOComparison.export_figures([figure], nprocs=1, force=True)
+                        except Exception as error:
+                            return {'skipped': 'image export failed: {0}'.format(error)}
+                        exports.append(time.perf_counter() - tfigure)
+                elapsed += time.perf_counter() - start
+                nfigures += len(figures)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        remove_stage_listener(listener)
+
+    latencies = np.array(construction) + (np.array(exports) if export else 0.0)
+    results = {'figures': nfigures,
+               'seconds': elapsed,
+               'figures_per_second': nfigures / elapsed,
+               'latency_per_figure': latency_summary(latencies),
+               'construction_per_figure': latency_summary(construction),
+               'peak_traced_megabytes': peak / 1024**2}
+    if export:
+        results['export_per_figure'] = latency_summary(exports)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark loading and plotting of the MIRA metrics')
+    parser.add_argument('--slices', nargs='+', default=list(BENCHMARK_SLICES),
+                        choices=list(BENCHMARK_SLICES), help='Dataset slices to load')
+    parser.add_argument('--strategies', nargs='+', default=list(BENCHMARK_STRATEGIES),
+                        choices=list(BENCHMARK_STRATEGIES), help='Loader strategies to compare')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed passes')
+    parser.add_argument('--no-plot', action='store_true', help='Skip the plot_dataset benchmarks')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = {'environment': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                               'python': platform.python_version(),
+                               'numpy': np.__version__,
+                               'pandas': pd.__version__,
+                               'cpus': os.cpu_count()},
+               'loaders': {},
+               'plot': {}}
+
+    # Keep stdout for the JSON results
+    with contextlib.redirect_stdout(sys.stderr):
+        for slicename in args.slices:
+            results['loaders'][slicename] = {}
+            for strategy in args.strategies:
+                print('Benchmarking {0} with {1}'.format(slicename, strategy))
+                results['loaders'][slicename][strategy] = benchmark_loader(slicename, strategy, args.repeat)
+
+        if not args.no_plot:
+            print('Benchmarking plot_dataset')
+            results['plot']['figures'] = benchmark_plot(export=False, repeat=args.repeat)
+            results['plot']['figures+export'] = benchmark_plot(export=True)
+
+    if sys.platform != 'win32':
+        import resource
+        results['environment']['max_rss_megabytes'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    output = json.dumps(results, indent=1)
+    if args.output:
+        with open(args.output, 'w') as foutput:
+            foutput.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
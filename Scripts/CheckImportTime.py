@@ -0,0 +1,93 @@
+'''
+Measure the import time of the MIRA dataset access library and check that it
+does not pull in the plotting or statistics backends.
+
+Each measurement runs "python -X importtime -c 'import <module>'" in a fresh
+interpreter, and the fastest of several runs is reported. A JSON record can be
+appended to a history file to track the import cost over time, and the script
+exits with a non-zero status when the budget is exceeded or a heavy backend is
+imported.
+
+Usage:
+python CheckImportTime.py [--module MIRADatasets] [--budget 1.5] [--history importtime.jsonl]
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# Modules that must not be imported by the dataset access library
+HEAVY_MODULES = ['plotly', 'chart_studio', 'scipy', 'pyshtools', 'IPython']
+
+# Maximum cumulative import time in seconds
+IMPORT_TIME_BUDGET = 1.5
+
+
+def measure_import_time(module, repeat=3):
+    '''
+    Import a module in fresh interpreters and parse the -X importtime output
+
+    Parameters:
+    module (string): Name of the module to import
+    repeat (int): Number of measurements; the fastest is returned
+
+    Returns:
+    dict: The total import time in seconds, the self time of each imported
+          module in seconds and the list of imported top-level packages
+
+    '''
+    best = None
+    scriptdir = os.path.dirname(os.path.abspath(__file__))
+    for irun in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                cwd=scriptdir, capture_output=True, text=True, check=True)
+        selftimes = {}
+        total = 0.0
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            selftime, cumulative, name = [field.strip() for field in line[len('import time:'):].split('|')]
+            selftimes[name] = int(selftime) * 1e-6
+            if name == module:
+                total = int(cumulative) * 1e-6
+        if best is None or total < best['total']:
+            best = {'total': total, 'modules': selftimes}
+
+    best['packages'] = sorted(set(name.split('.')[0] for name in best['modules']))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Track the import time of the MIRA dataset library')
+    parser.add_argument('--module', default='MIRADatasets', help='Module to import')
+    parser.add_argument('--budget', type=float, default=IMPORT_TIME_BUDGET,
+                        help='Maximum cumulative import time in seconds')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of measurements')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest modules to list')
+    parser.add_argument('--history', help='Append the measurement as a JSON line to this file')
+    args = parser.parse_args()
+
+    measurement = measure_import_time(args.module, args.repeat)
+    heavy = [name for name in HEAVY_MODULES if name in measurement['packages']]
+
+    print('import {0}: {1:.3f} s (budget {2:.3f} s)'.format(
+        args.module, measurement['total'], args.budget))
+    for name, selftime in sorted(measurement['modules'].items(), key=lambda item: -item[1])[:args.top]:
+        print('  {0:8.1f} ms  {1}'.format(selftime * 1e3, name))
+    if heavy:
+        print('Heavy modules imported: ', ', '.join(heavy))
+
+    if args.history:
+        record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'module': args.module,
+                  'total': measurement['total'], 'packages': measurement['packages'],
+                  'heavy': heavy}
+        with open(args.history, 'a') as fhistory:
+            fhistory.write(json.dumps(record) + '\n')
+
+    return 1 if heavy or measurement['total'] > args.budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
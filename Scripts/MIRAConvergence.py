@@ -0,0 +1,154 @@
+'''
+Convergence analysis of the MIRA metrics datasets with respect to mesh refinement.
+'''
+import pandas as pd
+import numpy as np
+
+from MIRADatasets import (NRESOLUTIONS, GRIDTYPES, GRIDELEMS, REMAPITERATIONS, METRICSNAMES,
+                          METHOD_VARIATIONS, CONVERGENCE_METRICS, ESMF_METHOD_ORDERS, build_sweep,
+                          get_dataset_key, load_many_values)
+
+__all__ = ['NOMINAL_ORDER_OFFSETS', 'get_mesh_spacing', 'get_grid_spacings', 'get_nominal_order',
+           'fit_power_law', 'compute_convergence_rates']
+
+# Difference between the nominal order of accuracy of a method and the order in
+# its case keys: the WLS-ENOR datasets are labelled with the polynomial degree p
+NOMINAL_ORDER_OFFSETS = {'WLS-ENOR': 1}
+
+
+def get_mesh_spacing(nelems):
+    '''
+    Return the mean spacing of a mesh with nelems elements on the unit sphere
+    '''
+    return np.sqrt(4.0 * np.pi / np.asarray(nelems, dtype=np.float64))
+
+
+def get_grid_spacings(gridtype):
+    '''
+    Return the mean spacing of the source and target grids of a grid combo
+    (index into GRIDTYPES) for each of the uniformly refined resolutions
+    '''
+    srcgrid, tgtgrid = GRIDTYPES[gridtype].split('-')
+    return get_mesh_spacing(GRIDELEMS[srcgrid]), get_mesh_spacing(GRIDELEMS[tgtgrid])
+
+
+def get_nominal_order(method, subtype, order):
+    '''
+    Return the nominal order of accuracy of a method variation given the
+    method, subtype and order of its case keys
+    '''
+    if method == 'ESMF':
+        return ESMF_METHOD_ORDERS[subtype]
+    return order + NOMINAL_ORDER_OFFSETS.get(method, 0)
+
+
+def fit_power_law(h, errors):
+    '''
+    Least-squares fit of log10|errors| = p log10(h) + c along the last axis,
+    batched over all leading axes. Points with zero or non-finite errors are
+    excluded from the fit of their series.
+
+    Parameters:
+    h (numpy array): Mesh spacings, broadcastable to errors
+    errors (numpy array): Error values with the resolutions along the last axis
+
+    Returns:
+    numpy array: The observed orders p
+    numpy array: The intercepts c
+    numpy array: The RMS of the fit residuals in log10 space
+    numpy array: The number of points used in each fit (NaN results when fewer than 2)
+
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = np.log10(np.abs(errors))
+        x = np.broadcast_to(np.log10(h), y.shape)
+        valid = np.isfinite(y)
+        npoints = valid.sum(axis=-1)
+        xmean = np.where(valid, x, 0.0).sum(axis=-1) / npoints
+        ymean = np.where(valid, y, 0.0).sum(axis=-1) / npoints
+        dx = np.where(valid, x - xmean[..., None], 0.0)
+        dy = np.where(valid, y - ymean[..., None], 0.0)
+        slope = (dx * dy).sum(axis=-1) / (dx * dx).sum(axis=-1)
+        intercept = ymean - slope * xmean
+        residual = np.sqrt(((dy - slope[..., None] * dx) ** 2).sum(axis=-1) / npoints)
+
+    enough = npoints >= 2
+    return (np.where(enough, slope, np.nan), np.where(enough, intercept, np.nan),
+            np.where(enough, residual, np.nan), npoints)
+
+
+def compute_convergence_rates(metrics=CONVERGENCE_METRICS, methods=METHOD_VARIATIONS,
+                              gridtypes=None, variables=None, refinement='both',
+                              fixedres=NRESOLUTIONS - 1, nprocs=None):
+    '''
+    Compute the observed convergence orders of the error metrics with respect to
+    mesh refinement for all uniformly refined cases in one batched least-squares pass.
+
+    Parameters:
+    metrics (list): Metrics to fit. Default: CONVERGENCE_METRICS
+    methods (list): (iMETHOD, subPath) pairs of the method variations. Default: METHOD_VARIATIONS
+    gridtypes (list): Grid combos to include. Default: all of GRIDTYPES
+    variables (list): Indices into DATAVARIABLES. Default: all variables
+    refinement (string): 'both' refines source and target together (iSRC == iTGT), while
+                         'source'/'target' refine only one grid with the other fixed at fixedres.
+                         The mesh spacing h is that of the coarser of the refined grids.
+    fixedres (int): Resolution index of the grid that is not refined. Default: finest
+    nprocs (int): Number of worker processes for loading the datasets, see load_many
+
+    Returns:
+    pandas dataframe: One row per (method, subtype, grid, variable, order, iteration, metric)
+                      with the observed_order, the nominal_order of the method, their
+                      difference (order_difference, negative when convergence is slower than
+                      nominal) and the intercept, residual and npoints of the fit
+
+    '''
+    assert(refinement in ['both', 'source', 'target'])
+    if gridtypes is None:
+        gridtypes = range(len(GRIDTYPES))
+    if refinement == 'both':
+        resolutions = [(ires, ires) for ires in range(NRESOLUTIONS)]
+    elif refinement == 'source':
+        resolutions = [(ires, fixedres) for ires in range(NRESOLUTIONS)]
+    else:
+        resolutions = [(fixedres, ires) for ires in range(NRESOLUTIONS)]
+
+    cases = build_sweep(methods, gridtypes, resolutions, variables)
+    keys, values = load_many_values([get_dataset_key(*case) for case in cases], nprocs)
+    imetrics = [METRICSNAMES.index(metric) for metric in metrics]
+
+    # Gather the series over resolutions: errors[group, iteration, metric, resolution]
+    groups = {}
+    for key in keys:
+        groups.setdefault(key[:3] + key[5:], len(groups))
+    errors = np.full((len(groups), len(REMAPITERATIONS), len(metrics), NRESOLUTIONS), np.nan)
+    spacings = np.full((len(groups), NRESOLUTIONS), np.nan)
+    for key, value in zip(keys, values):
+        igroup = groups[key[:3] + key[5:]]
+        hsrc, htgt = get_grid_spacings(GRIDTYPES.index(key[2]))
+        ires = key[4] if refinement == 'target' else key[3]
+        if refinement == 'both':
+            spacings[igroup, ires] = max(hsrc[ires], htgt[ires])
+        elif refinement == 'source':
+            spacings[igroup, ires] = hsrc[ires]
+        else:
+            spacings[igroup, ires] = htgt[ires]
+        errors[igroup, :, :, ires] = value[:, imetrics]
+
+    order, intercept, residual, npoints = fit_power_law(spacings[:, None, None, :], errors)
+
+    # Flatten into a tidy table
+    ngroups, niterations, nmetrics = order.shape
+    groupkeys = list(groups)
+    table = {}
+    for idim, dim in enumerate(['method', 'subtype', 'grid', 'variable', 'order']):
+        table[dim] = np.repeat([groupkey[idim] for groupkey in groupkeys], niterations * nmetrics)
+    table['iteration'] = np.tile(np.repeat(REMAPITERATIONS, nmetrics), ngroups)
+    table['metric'] = np.tile(metrics, ngroups * niterations)
+    table['observed_order'] = order.ravel()
+    table['nominal_order'] = np.repeat([get_nominal_order(groupkey[0], groupkey[1], groupkey[4])
+                                        for groupkey in groupkeys], niterations * nmetrics)
+    table['order_difference'] = table['observed_order'] - table['nominal_order']
+    table['intercept'] = intercept.ravel()
+    table['residual'] = residual.ravel()
+    table['npoints'] = npoints.ravel()
+    return pd.DataFrame(table)
@@ -0,0 +1,1305 @@
+'''
+Access to the MIRA metrics datasets: the constants describing the study, the
+catalog of the datasets under MetricsData, the consolidated metrics store and
+the dataset loaders. Only numpy and pandas are imported so that batch jobs
+needing the metric values do not pay for the plotting backends; see
+CheckImportTime.py.
+'''
+import os
+import json
+import io
+import bz2
+import zlib
+import shutil
+from collections import OrderedDict
+import pandas as pd
+import numpy as np
+
+from MIRAProfiling import stage
+
+# Public names, re-exported by ROOComparison. The path and loader settings
+# (MetricsFilePath, MetricsStorePath, USE_*) are read by the loaders when called,
+# so they are not exported: set them on MIRADatasets or with set_metrics_paths.
+__all__ = ['NMETHODS', 'NDATASETS', 'NRESOLUTIONS',
+           'METHODS', 'GRIDTYPES', 'DATAVARIABLES', 'CSRES', 'CSELEMS', 'ICODRES', 'ICODELEMS',
+           'RLLRES', 'RLLELEMS', 'NRRMRESOLUTIONS', 'RRMCSELEMS', 'RRMICODELEMS', 'GRIDELEMS',
+           'CONVERGENCE_METRICS', 'RESOLUTION_LABELS', 'RRM_RESOLUTION_LABELS',
+           'TR_SUPPORTED_ORDERS', 'TR_SUBTYPES', 'GMLS_SUPPORTED_ORDERS', 'GMLS_SUBTYPES',
+           'WLSENOR_SUPPORTED_ORDERS', 'ESMF_SUPPORTED_ORDERS', 'ESMF_SUBTYPES',
+           'ESMF_METHOD_ORDERS', 'SUPPORTED_ORDERS', 'METHOD_VARIATIONS',
+           'METRICSNAMES', 'riter', 'REMAPITERATIONS', 'STORE_DIMENSIONS', 'METRICSSTORE_VALUES',
+           'METRICSSTORE_INDEX', 'METRICSSTORE_SEGMENT_PREFIX', 'METRICSCATALOG_FILE',
+           'FRAME_CACHE_ENTRIES', 'FRAME_CACHE_BYTES', 'DECOMPRESSED_CACHE_DIRECTORY', 'COMPACT_ENCODINGS',
+           'COMPACT_RELATIVE_ERROR', 'COMPACT_COMPRESSION_LEVEL', 'COMPACT_CHUNK_CASES',
+           'set_metrics_paths', 'get_store_directory', 'get_dataset_key', 'parse_metrics_filename', 'match_case_keys',
+           'MetricsCatalog', 'get_metrics_catalog', 'update_metrics_catalog',
+           'validate_metrics_file', 'check_metrics_data', 'read_metrics_file', 'MetricsStore',
+           'build_metrics_store', 'append_metrics_store', 'get_metrics_store', 'FrameCache',
+           'configure_frame_cache', 'get_relative_errors', 'CompactArchive',
+           'configure_compact_archive', 'set_compact_archive', 'get_compact_archive',
+           'get_decompressed_file',
+           'load_dataset', 'get_supported_orders', 'get_dataset', 'get_rrm_dataset', 'build_sweep',
+           'load_many_values', 'load_many']
+
+# Global variables
+NMETHODS = 4
+NDATASETS = 3
+NRESOLUTIONS = 5
+MetricsFilePath = '../MetricsData/'
+MetricsStorePath = '../MetricsStore/'
+
+# Our reference data resolutions for different grids
+METHODS = ['TempestRemap', 'GMLS', 'WLS-ENOR', 'ESMF']
+GRIDTYPES = ['CS-MPAS', 'MPAS-RLL', 'RLL-CS']
+DATAVARIABLES = ['AnalyticalFun1', 'AnalyticalFun2',
+                 'CloudFraction', 'Topography', 'TotalPrecipWater']
+CSRES = ['16', '32', '64', '128', '256']
+CSELEMS = [1536, 6144, 24576, 98304, 393216]
+ICODRES = ['16', '32', '64', '128', '256']
+ICODELEMS = [2562, 10242, 40962, 163842, 655362]
+RLLRES = ['30-60', '90-180', '180-360', '360-720', '720-1440']
+RLLELEMS = [1800, 16200, 64800, 259200, 1036800]
+
+NRRMRESOLUTIONS = 3
+RRMCSELEMS = [15858, 112606, 247328]
+RRMICODELEMS = [15970, 28535, 67886]
+
+# Element counts of the grids in each grid combo and the error metrics that
+# are expected to converge with mesh refinement
+GRIDELEMS = {'CS': CSELEMS, 'MPAS': ICODELEMS, 'RLL': RLLELEMS}
+CONVERGENCE_METRICS = ['GL1', 'GL2', 'GLinf', 'H12T', 'H1T', 'H12S', 'H1S']
+
+# Resolution labels used in the metrics filenames for each grid prefix. The
+# RLL datasets of some methods are labelled with the CS/ICOD resolutions.
+RESOLUTION_LABELS = {'CS': [CSRES], 'ICOD': [ICODRES], 'RLL': [RLLRES, CSRES]}
+RRM_RESOLUTION_LABELS = {'cs': [CSRES[1:4]], 'CS': [CSRES[1:4]], 'RRMr': [CSRES[0:3]],
+                         'icodr': [['3', '4', '5']], 'ICOD': [ICODRES[1:4]], 'MPAS': [ICODRES[0:3]]}
+
+# Supported orders for each method
+TR_SUPPORTED_ORDERS = [1, 2, 3, 4]
+TR_SUBTYPES = ['', 'CAAS']
+GMLS_SUPPORTED_ORDERS = [2, 3, 4, 5]
+GMLS_SUBTYPES = ['', 'CAAS', 'Normalized']
+WLSENOR_SUPPORTED_ORDERS = [2, 3, 4]
+ESMF_SUPPORTED_ORDERS = [1, 2]
+# ESMF regridding methods (subtypes) as labelled in the dataset filenames, and their order
+ESMF_METHOD_ORDERS = {'conserve': 1, 'conserve2nd': 2, 'bilinear': 2}
+ESMF_SUBTYPES = list(ESMF_METHOD_ORDERS)
+SUPPORTED_ORDERS = [TR_SUPPORTED_ORDERS, GMLS_SUPPORTED_ORDERS,
+                    WLSENOR_SUPPORTED_ORDERS, ESMF_SUPPORTED_ORDERS]
+# (iMETHOD, subPath) of every method variation in the datasets
+METHOD_VARIATIONS = [(0, -1), (1, 0), (1, 1), (2, -1), (3, -1)]
+
+# Store the metrics names available
+METRICSNAMES = ['GC', 'GL1', 'GL2', 'GLinf', 'GMaxE', 'GMinE', 'LMaxL1', 'LMaxL2',
+                'LMaxLm', 'LMinL1', 'LMinL2', 'LMinLm', 'H12T', 'H1T', 'H12S', 'H1S']
+
+# Store the reference remap iteration points used in the study for plotting
+riter = np.linspace(10, 1000, 100, dtype='int32')
+REMAPITERATIONS = np.insert(riter, 0, 1, axis=0)
+
+# Consolidated metrics store: case dimensions and file layout
+STORE_DIMENSIONS = ['method', 'subtype', 'grid',
+                    'src', 'tgt', 'variable', 'order']
+METRICSSTORE_VALUES = 'metrics.npy'
+METRICSSTORE_INDEX = 'index.json'
+METRICSSTORE_SEGMENT_PREFIX = 'metrics-segment-'
+METRICSCATALOG_FILE = 'catalog.json'
+USE_METRICS_STORE = True
+_metricsStore = None
+_metricsCatalog = None
+# Paths the opened catalog and store were loaded for, so they are reopened when
+# MetricsFilePath or MetricsStorePath change
+_metricsStoreSource = None
+_metricsCatalogSource = None
+
+# Caching of loaded datasets: an in-memory LRU of dataframes bounded by the
+# number of entries and bytes, and an on-disk cache of decompressed bz2 files
+FRAME_CACHE_ENTRIES = 512
+FRAME_CACHE_BYTES = 128 * 1024 * 1024
+DECOMPRESSED_CACHE_DIRECTORY = 'decompressed'
+USE_DECOMPRESSED_CACHE = True
+
+# Compact in-memory archive (see configure_compact_archive): metrics rounded to
+# float32, whose unit roundoff bounds the relative error of every value, and
+# optionally XOR-delta encoded over the remap iterations and zlib compressed
+COMPACT_ENCODINGS = ['float32', 'delta']
+COMPACT_RELATIVE_ERROR = 2.0**-24
+COMPACT_COMPRESSION_LEVEL = 6
+COMPACT_CHUNK_CASES = 1024
+_compactArchive = None
+
+
+def set_metrics_paths(metricspath=None, storepath=None):
+    '''
+    Set the directories of the metrics datasets (MetricsFilePath) and of the
+    derived files (MetricsStorePath). The catalog, store and caches of other
+    directories are dropped on their next use.
+
+    Parameters:
+    metricspath (string): Directory of the metrics datasets. Default: unchanged
+    storepath (string): Directory of the catalog, store, caches and tables. Default: unchanged
+
+    '''
+    global MetricsFilePath, MetricsStorePath
+    if metricspath is not None:
+        MetricsFilePath = os.path.join(metricspath, '')
+    if storepath is not None:
+        MetricsStorePath = os.path.join(storepath, '')
+
+
+def get_store_directory(name):
+    '''
+    Return the path of a directory under MetricsStorePath. The derived paths
+    are resolved when used, so they follow changes to MetricsStorePath.
+    '''
+    return os.path.join(MetricsStorePath, name, '')
+
+
+def get_dataset_key(iMETHOD, GridType, iSRC, iTGT, iVARin, Order, subPath=-1, isRRM=False):
+    '''
+    Return the case key used to index a dataset in the consolidated metrics store
+
+    Parameters:
+    iMETHOD (int): Parameter ranging from 0-3. 0: TempestRemap, 1: GMLS, 2: WLS-ENOR, 3: ESMF
+    GridType (int): Parameter ranging from 0-2. 0: CS-ICOD, 1: ICOD-RLL, 2: RLL-CS. Ignored for RRM cases.
+    iSRC (int): Index of the source grid resolution in the grid combo
+    iTGT (int): Index of the target grid resolution in the grid combo
+    iVARin (int): Parameter ranging between 0-4 indicating analytical and real sampled fields
+    Order (int): Order of the method (iMETHOD)
+    subPath (int): Sub-path selecting a variation of the method datasets: an index into
+                   GMLS_SUBTYPES for GMLS or ESMF_SUBTYPES for ESMF. Default: -1 (None).
+    isRRM (bool): Whether the key refers to a regionally refined case
+
+    Returns:
+    tuple: (method, subtype, grid, src, tgt, variable, order) as laid out in STORE_DIMENSIONS
+
+    '''
+    if iMETHOD == 1:
+        if subPath not in [0, 1]:
+            raise ValueError('GMLS datasets are selected with subPath 0 (plain) or 1 (CAAS), got {0}'.format(subPath))
+        subtype = GMLS_SUBTYPES[subPath]
+    elif iMETHOD == 3:
+        # Without a sub-path the ESMF method is the first one of the requested order
+        if subPath >= 0:
+            if subPath >= len(ESMF_SUBTYPES):
+                raise ValueError('ESMF datasets are selected with subPath 0-{0} ({1})'.format(
+                    len(ESMF_SUBTYPES) - 1, ', '.join(ESMF_SUBTYPES)))
+            subtype = ESMF_SUBTYPES[subPath]
+        else:
+            subtypes = [method for method in ESMF_SUBTYPES if ESMF_METHOD_ORDERS[method] == Order]
+            if not subtypes:
+                raise ValueError('No ESMF method of order {0}, the ESMF methods are {1}'.format(
+                    Order, ESMF_METHOD_ORDERS))
+            subtype = subtypes[0]
+    else:
+        subtype = ''
+    grid = 'RRM' if isRRM else GRIDTYPES[GridType]
+    return (METHODS[iMETHOD], subtype, grid, int(iSRC), int(iTGT),
+            DATAVARIABLES[iVARin], int(Order))
+
+
+def parse_metrics_filename(relpath):
+    '''
+    Parse the path of a metrics dataset relative to MetricsFilePath into its case key.
+
+    The filenames follow a handful of patterns, e.g.
+        UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS16_ICOD16_O4_Topography.csv
+        UniformlyRefined/ESMF/RLL-CS/conserve2nd/metrics_RLL16_CS16_conserve2nd_Topography.csv
+        RegionallyRefined/WLS-ENOR/degree-2/metrics_RRMr16_MPAS16_p=2_Topography.csv
+        RegionallyRefined/TempestRemap/degree-0/metrics_cs32_icodr3_O1_Topography.csv.bz2
+    and the resolution labels are mapped back onto the resolution indices used by get_dataset.
+
+    Returns:
+    tuple: The case key as laid out in STORE_DIMENSIONS, or None if the path is not a metrics dataset
+
+    '''
+    parts = relpath.replace(os.sep, '/').split('/')
+    filename = parts[-1]
+    for extension in ['.csv.bz2', '.csv']:
+        if filename.endswith(extension):
+            filename = filename[:-len(extension)]
+            break
+    else:
+        return None
+
+    tokens = filename.split('_')
+    if len(tokens) != 5 or tokens[0] != 'metrics' or tokens[4] not in DATAVARIABLES:
+        return None
+    if parts[0] == 'UniformlyRefined' and len(parts) == 5 and parts[2] in GRIDTYPES:
+        grid = parts[2]
+    elif parts[0] == 'RegionallyRefined' and len(parts) == 4:
+        grid = 'RRM'
+    else:
+        return None
+
+    # Method directories are either the method name or "<method>-<subtype>"
+    if parts[1] in METHODS:
+        method, subtype = parts[1], ''
+    else:
+        method = next((m for m in METHODS if parts[1].startswith(m + '-')), None)
+        if method is None:
+            return None
+        subtype = parts[1][len(method) + 1:]
+
+    ordertoken = tokens[3]
+    if ordertoken.startswith('O') and ordertoken[1:].isdigit():
+        order = int(ordertoken[1:])
+    elif ordertoken.startswith('p=') and ordertoken[2:].isdigit():
+        order = int(ordertoken[2:])
+    elif method == 'ESMF' and ordertoken in ESMF_SUBTYPES:
+        subtype = ordertoken
+        order = ESMF_METHOD_ORDERS[ordertoken]
+    else:
+        return None
+
+    resolutions = RRM_RESOLUTION_LABELS if grid == 'RRM' else RESOLUTION_LABELS
+    indices = []
+    for token in tokens[1:3]:
+        prefix = token.rstrip('0123456789-')
+        label = token[len(prefix):]
+        index = next((labels.index(label) for labels in resolutions.get(prefix, [])
+                      if label in labels), None)
+        if index is None:
+            return None
+        indices.append(index)
+
+    return (method, subtype, grid, indices[0], indices[1], tokens[4], order)
+
+
+def match_case_keys(keys, criteria):
+    '''
+    Return the positions of the case keys that match all given dimension values.
+    A criterion can be a single value or a list of accepted values.
+    '''
+    for dim in criteria:
+        assert(dim in STORE_DIMENSIONS)
+    accepted = {STORE_DIMENSIONS.index(dim): (values if isinstance(values, (list, tuple, set)) else [values])
+                for dim, values in criteria.items()}
+    return [pos for pos, key in enumerate(keys)
+            if all(key[idim] in values for idim, values in accepted.items())]
+
+
+class MetricsCatalog:
+    '''
+    Manifest of all metrics datasets available under MetricsFilePath, keyed by
+    the case key (see STORE_DIMENSIONS). The filesystem is walked once by
+    scan() and the result persisted, so dataset lookups need no filesystem calls.
+    '''
+
+    def __init__(self, files, root=None):
+        # Map of case key to the dataset path relative to MetricsFilePath
+        self.files = files
+        # Absolute path of the scanned directory, None if unknown
+        self.root = root
+
+    @classmethod
+    def scan(cls, rootpath=None):
+        '''
+        Walk rootpath (default: MetricsFilePath) and parse every metrics dataset
+        filename. When both a plain and a bz2 compressed copy exist, the
+        compressed copy is used. The contents are checked when the store is
+        built (see build_metrics_store).
+        '''
+        if rootpath is None:
+            rootpath = MetricsFilePath
+        if not os.path.isdir(rootpath):
+            raise IOError('The metrics datasets directory {0} does not exist (run from Scripts/ or set '
+                          'MIRADatasets.MetricsFilePath)'.format(os.path.abspath(rootpath)))
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(rootpath):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                relpath = os.path.relpath(os.path.join(dirpath, filename), rootpath)
+                key = parse_metrics_filename(relpath)
+                if key is None:
+                    continue
+                if key not in files or relpath.endswith('.bz2'):
+                    files[key] = relpath
+        return cls(files, os.path.abspath(rootpath))
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r') as fcatalog:
+            catalog = json.load(fcatalog)
+        assert(catalog['dimensions'] == STORE_DIMENSIONS)
+        return cls({tuple(case[:-1]): case[-1] for case in catalog['cases']}, catalog.get('root'))
+
+    def save(self, filename):
+        catalog = {'dimensions': STORE_DIMENSIONS,
+                   'root': self.root,
+                   'cases': [list(key) + [relpath] for key, relpath in sorted(self.files.items())]}
+        with open(filename + '.tmp', 'w') as fcatalog:
+            json.dump(catalog, fcatalog)
+        os.replace(filename + '.tmp', filename)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, key):
+        return key in self.files
+
+    def add(self, relpath):
+        '''
+        Add the dataset at relpath (relative to MetricsFilePath) to the catalog,
+        with the same preference for the bz2 compressed copies as scan().
+
+        Returns:
+        tuple: The case key of the dataset, or None if relpath is not a metrics dataset
+
+        '''
+        key = parse_metrics_filename(relpath)
+        if key is None:
+            return None
+        current = self.files.get(key)
+        if current is None or relpath.endswith('.bz2') or not current.endswith('.bz2'):
+            self.files[key] = relpath
+        return key
+
+    def get_filename(self, key):
+        '''
+        Return the path of the dataset for a case key, or "" if it does not exist
+        '''
+        relpath = self.files.get(key)
+        return MetricsFilePath + relpath if relpath is not None else ""
+
+    def select(self, **criteria):
+        '''
+        Return the sorted case keys matching the given dimension values, e.g.
+        select(method='GMLS', subtype='CAAS', grid='CS-MPAS', order=[3, 4])
+        '''
+        keys = sorted(self.files)
+        return [keys[pos] for pos in match_case_keys(keys, criteria)]
+
+    def available(self, dimension, **criteria):
+        '''
+        Return the sorted values of one dimension over all cases matching the criteria,
+        e.g. available('order', method='WLS-ENOR')
+        '''
+        idim = STORE_DIMENSIONS.index(dimension)
+        return sorted(set(key[idim] for key in self.select(**criteria)))
+
+
+def get_metrics_catalog(rescan=False):
+    '''
+    Return the catalog of metrics datasets. The persisted manifest is loaded if
+    present and was written for the current MetricsFilePath; otherwise (or with
+    rescan=True) MetricsFilePath is scanned once and the manifest is written
+    for the following runs.
+    '''
+    global _metricsCatalog, _metricsCatalogSource
+    catalogfile = os.path.join(MetricsStorePath, METRICSCATALOG_FILE)
+    root = os.path.abspath(MetricsFilePath)
+    if _metricsCatalogSource != (root, os.path.abspath(catalogfile)):
+        _metricsCatalog = None
+        _frameCache.clear()
+    if _metricsCatalog is None and not rescan and os.path.exists(catalogfile):
+        catalog = MetricsCatalog.load(catalogfile)
+        # Manifests written before the root was recorded are assumed current
+        if catalog.root in (None, root):
+            _metricsCatalog = catalog
+    if rescan or _metricsCatalog is None:
+        _metricsCatalog = MetricsCatalog.scan(MetricsFilePath)
+        os.makedirs(MetricsStorePath, exist_ok=True)
+        _metricsCatalog.save(catalogfile)
+        _frameCache.clear()
+    _metricsCatalogSource = (root, os.path.abspath(catalogfile))
+    return _metricsCatalog
+
+
+def update_metrics_catalog(relpaths):
+    '''
+    Add new or changed datasets (paths relative to MetricsFilePath) to the
+    catalog without rescanning MetricsFilePath, and persist the catalog
+
+    Returns:
+    list: The case keys of the datasets
+    '''
+    catalog = get_metrics_catalog()
+    keys = [key for key in (catalog.add(relpath) for relpath in relpaths) if key is not None]
+    os.makedirs(MetricsStorePath, exist_ok=True)
+    catalog.save(os.path.join(MetricsStorePath, METRICSCATALOG_FILE))
+    _frameCache.clear()
+    # Replaced datasets are read again from the store or the files
+    if _compactArchive is not None:
+        _compactArchive.discard(keys)
+    return keys
+
+
+def validate_metrics_file(filename):
+    '''
+    Check that a metrics CSV (optionally bz2 compressed) file has the METRICSNAMES
+    header and one row per entry in REMAPITERATIONS, plus the optional leading
+    row of the initial field, with numeric values
+
+    Returns:
+    list: The problems found, empty if the file is valid
+    '''
+    try:
+        data = read_metrics_file(filename)
+    except Exception as error:
+        return ['cannot be read: {0}'.format(error)]
+    return check_metrics_data(data)
+
+
+def check_metrics_data(data):
+    '''
+    Check the columns, rows and values of a dataframe read by read_metrics_file
+
+    Returns:
+    list: The problems found, empty if the data is valid
+    '''
+    problems = []
+    if list(data.columns) != METRICSNAMES:
+        problems.append('header {0} does not match METRICSNAMES'.format(','.join(map(str, data.columns))))
+    if len(data) != len(REMAPITERATIONS):
+        problems.append('has {0} rows instead of {1} (or {2} with the initial row)'.format(
+            len(data), len(REMAPITERATIONS), len(REMAPITERATIONS) + 1))
+    nonnumeric = [column for column in data.columns if not pd.api.types.is_numeric_dtype(data[column])]
+    if nonnumeric:
+        problems.append('non-numeric columns: ' + ','.join(map(str, nonnumeric)))
+    return problems
+
+
+def read_metrics_file(filename):
+    '''
+    Read a metrics CSV (optionally bz2 compressed) file into a dataframe with
+    one row per entry in REMAPITERATIONS.
+
+    The plain CSV files carry an extra leading row with the metrics of the
+    initial (un-remapped) field, while the compressed copies start directly
+    at the first remap iteration, so only drop the leading row when present.
+
+    Returns:
+    pandas dataframe: The metrics data indexed from 1 to len(REMAPITERATIONS)
+
+    '''
+    with stage('read') as timer:
+        with open(filename, 'rb') as fmetrics:
+            raw = fmetrics.read()
+        timer.nbytes = len(raw)
+    if filename.endswith('.bz2'):
+        with stage('decompress') as timer:
+            raw = bz2.decompress(raw)
+            timer.nbytes = len(raw)
+    with stage('parse', len(raw)):
+        data = pd.read_csv(io.BytesIO(raw))
+    if len(data) == len(REMAPITERATIONS) + 1:
+        with stage('drop') as timer:
+            data = data.drop(data.index[0])
+            timer.nbytes = int(data.memory_usage(index=True).sum())
+    data.index = pd.RangeIndex(1, len(data) + 1)
+    return data
+
+
+class MetricsStore:
+    '''
+    Consolidated, memory-mapped store of all metrics datasets.
+
+    The store is a float64 array of shape (cases, iterations, metrics) saved as
+    a .npy file along with a JSON index that maps each case key (see
+    STORE_DIMENSIONS) to its row in the array and its source file. The archive
+    is sparse in the method/order/subtype dimensions, so cases are kept along
+    one axis instead of padding a dense 8-dimensional array. Datasets ingested
+    later are appended as additional segments (see append_metrics_store), whose
+    cases replace any stored copy of the same case.
+    '''
+
+    def __init__(self, storepath=None):
+        if storepath is None:
+            storepath = MetricsStorePath
+        with open(os.path.join(storepath, METRICSSTORE_INDEX), 'r') as findex:
+            index = json.load(findex)
+        assert(index['dimensions'] == STORE_DIMENSIONS)
+        assert(index['metrics'] == METRICSNAMES)
+        # Absolute path of the datasets directory the store was built from, None if unknown
+        self.root = index.get('root')
+        segments = [{'values': METRICSSTORE_VALUES, 'cases': index['cases']}] + index.get('segments', [])
+
+        self.segments = []
+        self.keys = []
+        self.filenames = []
+        self.rows = {}
+        locations = []
+        for isegment, segment in enumerate(segments):
+            values = np.load(os.path.join(storepath, segment['values']), mmap_mode='r')
+            assert(values.shape == (len(segment['cases']), len(REMAPITERATIONS), len(METRICSNAMES)))
+            self.segments.append(values)
+            for row, case in enumerate(segment['cases']):
+                key = tuple(case[:-1])
+                if key not in self.rows:
+                    self.rows[key] = len(self.keys)
+                    self.keys.append(key)
+                    self.filenames.append(None)
+                    locations.append(None)
+                self.filenames[self.rows[key]] = MetricsFilePath + case[-1]
+                locations[self.rows[key]] = (isegment, row)
+        self.locations = np.array(locations, dtype=np.int64).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    @property
+    def values(self):
+        '''
+        The metrics of all cases with shape (cases, iterations, metrics): the
+        memory-mapped array of a single-segment store, else gathered in memory
+        '''
+        if len(self.segments) == 1:
+            return self.segments[0]
+        return self.take(range(len(self.keys)))
+
+    def take(self, rows):
+        '''
+        Return the metrics of the cases at the given rows with shape (len(rows), iterations, metrics)
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(self.segments) == 1:
+            return self.segments[0][rows]
+        values = np.empty((len(rows), len(REMAPITERATIONS), len(METRICSNAMES)))
+        segments, segmentrows = self.locations[rows, 0], self.locations[rows, 1]
+        for isegment, segment in enumerate(self.segments):
+            insegment = segments == isegment
+            values[insegment] = segment[segmentrows[insegment]]
+        return values
+
+    def get(self, key):
+        '''
+        Return the (dataframe, filename) pair for a case key, or (None, "") if not stored
+        '''
+        row = self.rows.get(key)
+        if row is None:
+            return None, ""
+        isegment, segmentrow = self.locations[row]
+        data = pd.DataFrame(np.array(self.segments[isegment][segmentrow]), columns=METRICSNAMES,
+                            index=pd.RangeIndex(1, len(REMAPITERATIONS) + 1))
+        return data, self.filenames[row]
+
+    def select(self, **criteria):
+        '''
+        Slice all cases matching the given dimension values, e.g.
+        select(method='GMLS', grid='CS-MPAS', variable='Topography').
+        A criterion can be a single value or a list of accepted values.
+
+        Returns:
+        list: The matching case keys
+        numpy array: The metrics of the cases with shape (len(keys), iterations, metrics)
+
+        '''
+        rows = match_case_keys(self.keys, criteria)
+        return [self.keys[row] for row in rows], self.take(rows)
+
+
+def _write_store_segment(filename, cases):
+    '''
+    Write the datasets of the (key, filename) cases into a .npy segment of the
+    store. The values are written to filename + '.tmp', which replaces filename
+    only once the index has been written (see _write_store_index), so a failed
+    write leaves the current store intact.
+    '''
+    shape = (len(REMAPITERATIONS), len(METRICSNAMES))
+    values = np.lib.format.open_memmap(filename + '.tmp', mode='w+', dtype=np.float64, shape=(len(cases),) + shape)
+    written = []
+    try:
+        for key, datafilename in cases:
+            try:
+                data = read_metrics_file(datafilename)
+                problems = check_metrics_data(data)
+            except Exception as error:
+                problems = ['cannot be read: {0}'.format(error)]
+            if problems:
+                print('Skipping invalid dataset {0}: {1}'.format(datafilename, '; '.join(problems)))
+                continue
+            values[len(written)] = data.to_numpy(dtype=np.float64)
+            written.append((key, datafilename))
+        values.flush()
+
+        # Drop the rows left for the skipped datasets
+        if len(written) < len(cases):
+            print('Skipped {0} of {1} datasets'.format(len(cases) - len(written), len(cases)))
+            packed = np.lib.format.open_memmap(filename + '.packed', mode='w+', dtype=np.float64,
+                                               shape=(len(written),) + shape)
+            packed[:] = values[:len(written)]
+            packed.flush()
+            del packed
+            os.replace(filename + '.packed', filename + '.tmp')
+    except BaseException:
+        del values
+        os.remove(filename + '.tmp')
+        raise
+    del values
+    return [list(key) + [os.path.relpath(datafilename, MetricsFilePath)] for key, datafilename in written]
+
+
+def _write_store_index(storepath, index, segmentfile):
+    '''
+    Write the store index and move the newly written segment in place
+    '''
+    indexfile = os.path.join(storepath, METRICSSTORE_INDEX)
+    with open(indexfile + '.tmp', 'w') as findex:
+        json.dump(index, findex)
+    segmentfile = os.path.join(storepath, segmentfile)
+    os.replace(segmentfile + '.tmp', segmentfile)
+    os.replace(indexfile + '.tmp', indexfile)
+
+
+def build_metrics_store(storepath=None):
+    '''
+    Pack every metrics dataset in the catalog into a consolidated store
+    that can be memory-mapped by MetricsStore. Any appended segments are
+    compacted into the rebuilt store. Datasets failing check_metrics_data are
+    reported and left out.
+
+    Parameters:
+    storepath (string): Directory to write the store to. Default: MetricsStorePath
+
+    Returns:
+    MetricsStore: The newly built store
+
+    '''
+    global _metricsStore
+    if storepath is None:
+        storepath = MetricsStorePath
+    catalog = get_metrics_catalog()
+    cases = [(key, catalog.get_filename(key)) for key in sorted(catalog.files)]
+    os.makedirs(storepath, exist_ok=True)
+    print('Packing {0} metrics datasets into {1}'.format(len(cases), storepath))
+
+    _metricsStore = None
+    index = {'dimensions': STORE_DIMENSIONS,
+             'metrics': METRICSNAMES,
+             'iterations': REMAPITERATIONS.tolist(),
+             'root': os.path.abspath(MetricsFilePath),
+             'cases': _write_store_segment(os.path.join(storepath, METRICSSTORE_VALUES), cases)}
+    _write_store_index(storepath, index, METRICSSTORE_VALUES)
+    for filename in os.listdir(storepath):
+        if filename.startswith(METRICSSTORE_SEGMENT_PREFIX) and filename.endswith('.npy'):
+            os.remove(os.path.join(storepath, filename))
+
+    _metricsStore = MetricsStore(storepath)
+    _frameCache.clear()
+    return _metricsStore
+
+
+def append_metrics_store(keys, storepath=None):
+    '''
+    Append the datasets of the given case keys to the consolidated store as a
+    new segment, without rewriting the stored cases. Stored copies of the same
+    cases are replaced by the appended ones.
+
+    Parameters:
+    keys (list): Case keys of datasets in the catalog
+    storepath (string): Directory of the store. Default: MetricsStorePath
+
+    Returns:
+    MetricsStore: The updated store
+
+    '''
+    global _metricsStore
+    if storepath is None:
+        storepath = MetricsStorePath
+    catalog = get_metrics_catalog()
+    cases = [(key, catalog.get_filename(key)) for key in sorted(set(keys))]
+    assert(all(filename for key, filename in cases)), 'Add the datasets to the catalog before the store'
+    with open(os.path.join(storepath, METRICSSTORE_INDEX), 'r') as findex:
+        index = json.load(findex)
+    segments = index.setdefault('segments', [])
+    segmentfile = '{0}{1:04d}.npy'.format(METRICSSTORE_SEGMENT_PREFIX, len(segments) + 1)
+    print('Appending {0} metrics datasets to {1}'.format(len(cases), os.path.join(storepath, segmentfile)))
+
+    _metricsStore = None
+    segments.append({'values': segmentfile,
+                     'cases': _write_store_segment(os.path.join(storepath, segmentfile), cases)})
+    _write_store_index(storepath, index, segmentfile)
+
+    _metricsStore = MetricsStore(storepath)
+    _frameCache.clear()
+    return _metricsStore
+
+
+def get_metrics_store():
+    '''
+    Return the consolidated metrics store if it has been built from the
+    current MetricsFilePath and USE_METRICS_STORE is enabled, else None. The
+    store is opened once per MetricsFilePath and MetricsStorePath.
+    '''
+    global _metricsStore, _metricsStoreSource
+    if not USE_METRICS_STORE:
+        return None
+    source = (os.path.abspath(MetricsFilePath), os.path.abspath(MetricsStorePath))
+    if _metricsStoreSource != source:
+        _metricsStore, _metricsStoreSource = None, source
+        _frameCache.clear()
+    if _metricsStore is None and os.path.exists(os.path.join(MetricsStorePath, METRICSSTORE_INDEX)):
+        store = MetricsStore(MetricsStorePath)
+        if store.root in (None, source[0]):
+            _metricsStore = store
+        else:
+            print('Not using the metrics store in {0}: it was built from {1}'.format(MetricsStorePath, store.root))
+            # Remember the mismatch so that the index is not read again
+            _metricsStore = False
+    return _metricsStore if _metricsStore is not False else None
+
+
+class FrameCache:
+    '''
+    Least-recently-used cache of loaded (dataframe, filename) pairs, bounded
+    by both the number of entries and the total bytes of the dataframes.
+    Dataframes are copied on the way in and out so callers can modify them freely.
+    '''
+
+    def __init__(self, maxentries=FRAME_CACHE_ENTRIES, maxbytes=FRAME_CACHE_BYTES):
+        self.maxentries = maxentries
+        self.maxbytes = maxbytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, ""
+        self.hits += 1
+        self.entries.move_to_end(key)
+        data, filename, nbytes = entry
+        return data.copy(), filename
+
+    def put(self, key, data, filename):
+        nbytes = int(data.memory_usage(index=True).sum())
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[2]
+        if self.maxentries <= 0 or nbytes > self.maxbytes:
+            return
+        self.entries[key] = (data.copy(), filename, nbytes)
+        self.nbytes += nbytes
+        while len(self.entries) > self.maxentries or self.nbytes > self.maxbytes:
+            self.nbytes -= self.entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+
+_frameCache = FrameCache()
+
+
+def configure_frame_cache(maxentries=FRAME_CACHE_ENTRIES, maxbytes=FRAME_CACHE_BYTES):
+    '''
+    Replace the dataset cache with an empty one with the given budget.
+    Pass maxentries=0 to disable caching of loaded datasets.
+    '''
+    global _frameCache
+    _frameCache = FrameCache(maxentries, maxbytes)
+    return _frameCache
+
+
+def get_relative_errors(approx, values):
+    '''
+    Return the relative errors of approximate metric values: zero where both are
+    equal (including NaN and infinities), infinite where a finite value became
+    non-finite or the reverse
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    approx = np.asarray(approx, dtype=np.float64)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        errors = np.abs(approx - values) / np.abs(values)
+    exact = (approx == values) | (np.isnan(approx) & np.isnan(values))
+    return np.where(exact, 0.0, np.where(np.isnan(errors), np.inf, errors))
+
+
+class CompactArchive:
+    '''
+    In-memory copy of the metrics of many cases in a compact representation.
+
+    Values are rounded to float32, so the relative error of every value is at
+    most COMPACT_RELATIVE_ERROR; zeros, NaN and infinities are exact. Values that
+    float32 cannot hold within that bound (beyond its range, as in diverged runs,
+    or subnormal) are kept exactly as float64 exceptions. With the 'delta'
+    encoding the float32 bit patterns of each metric are XOR-ed with those of the
+    previous remap iteration, byte-shuffled and zlib-compressed per case, so that
+    slowly varying series and runs of zeros take a few bits per value; cases are
+    decoded on access. The largest relative error of the values added so far is
+    kept in max_relative_error.
+    '''
+
+    def __init__(self, encoding='delta'):
+        assert(encoding in COMPACT_ENCODINGS)
+        self.encoding = encoding
+        self.chunks = []
+        self.rows = {}
+        self.filenames = {}
+        self.exceptions = {}
+        self.max_relative_error = 0.0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    @property
+    def keys(self):
+        return list(self.rows)
+
+    @property
+    def nbytes(self):
+        '''
+        Bytes of the encoded values and exceptions
+        '''
+        if self.encoding == 'float32':
+            nbytes = sum(chunk.nbytes for chunk in self.chunks)
+        else:
+            nbytes = sum(len(blob) for chunk in self.chunks for blob in chunk)
+        return nbytes + sum(index.nbytes + values.nbytes for index, values in self.exceptions.values())
+
+    def append(self, keys, values, filenames=None):
+        '''
+        Encode the metrics of cases, replacing any copy of the same cases
+
+        Parameters:
+        keys (list): The case keys, see STORE_DIMENSIONS
+        values (numpy array): Their metrics with shape (len(keys), iterations, metrics)
+        filenames (list): Their source files. Default: unknown
+
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        assert(values.shape == (len(keys), len(REMAPITERATIONS), len(METRICSNAMES)))
+        with stage('compact_encode') as timer:
+            with np.errstate(over='ignore'):
+                rounded = values.astype(np.float32)
+            errors = get_relative_errors(rounded, values)
+            inexact = errors > COMPACT_RELATIVE_ERROR
+            if errors.size:
+                self.max_relative_error = max(self.max_relative_error, float(np.where(inexact, 0.0, errors).max()))
+
+            if self.encoding == 'float32':
+                chunk = rounded
+            else:
+                series = np.ascontiguousarray(rounded.transpose(0, 2, 1)).view(np.uint32)
+                deltas = series.copy()
+                deltas[:, :, 1:] ^= series[:, :, :-1]
+                shuffled = deltas.view(np.uint8).reshape(len(keys), -1, 4).transpose(0, 2, 1)
+                chunk = [zlib.compress(np.ascontiguousarray(case).tobytes(), COMPACT_COMPRESSION_LEVEL)
+                         for case in shuffled]
+            timer.nbytes = values.nbytes
+
+        ichunk = len(self.chunks)
+        self.chunks.append(chunk)
+        for row, key in enumerate(keys):
+            key = tuple(key)
+            self.rows[key] = (ichunk, row)
+            self.filenames[key] = filenames[row] if filenames is not None else ""
+            self.exceptions.pop(key, None)
+            if inexact[row].any():
+                index = np.flatnonzero(inexact[row])
+                self.exceptions[key] = (index, values[row].ravel()[index])
+
+    def discard(self, keys):
+        '''
+        Drop cases, e.g. when their datasets have been replaced
+        '''
+        for key in keys:
+            self.rows.pop(key, None)
+            self.filenames.pop(key, None)
+            self.exceptions.pop(key, None)
+
+    def decode(self, key):
+        '''
+        Return the metrics of a case with shape (iterations, metrics), or None if not held
+        '''
+        location = self.rows.get(key)
+        if location is None:
+            return None
+        ichunk, row = location
+        if self.encoding == 'float32':
+            values = self.chunks[ichunk][row].astype(np.float64)
+        else:
+            shuffled = np.frombuffer(zlib.decompress(self.chunks[ichunk][row]), dtype=np.uint8)
+            deltas = shuffled.reshape(4, -1).T.copy().view(np.uint32).reshape(len(METRICSNAMES), -1)
+            series = np.bitwise_xor.accumulate(deltas, axis=1)
+            values = series.view(np.float32).T.astype(np.float64, order='C')
+        exceptions = self.exceptions.get(key)
+        if exceptions is not None:
+            values.reshape(-1)[exceptions[0]] = exceptions[1]
+        return values
+
+    def take(self, keys):
+        '''
+        Return the metrics of the given cases with shape (len(keys), iterations, metrics)
+        '''
+        values = np.empty((len(keys), len(REMAPITERATIONS), len(METRICSNAMES)))
+        for row, key in enumerate(keys):
+            values[row] = self.decode(key)
+        return values
+
+    def get(self, key):
+        '''
+        Return the (dataframe, filename) pair for a case key, or (None, "") if not held
+        '''
+        values = self.decode(key)
+        if values is None:
+            return None, ""
+        data = pd.DataFrame(values, columns=METRICSNAMES, index=pd.RangeIndex(1, len(REMAPITERATIONS) + 1))
+        return data, self.filenames[key]
+
+    def verify(self, keys=None):
+        '''
+        Return the largest relative error of the held values against the
+        full-precision metrics files of the given cases (default: all)
+        '''
+        maxerror = 0.0
+        for key in (self.keys if keys is None else keys):
+            data = read_metrics_file(get_decompressed_file(self.filenames[key] or
+                                                           get_metrics_catalog().get_filename(key)))
+            maxerror = max(maxerror, float(get_relative_errors(self.decode(key), data.to_numpy()).max()))
+        return maxerror
+
+
+def configure_compact_archive(encoding='delta', chunksize=COMPACT_CHUNK_CASES, nprocs=None):
+    '''
+    Hold all catalogued cases in memory in a compact representation (see
+    CompactArchive) that the loaders use before the store and the dataset files.
+    The cases are read from the consolidated store when built, else from the
+    dataset files, chunksize cases at a time. Pass encoding=None to drop it.
+
+    Returns:
+    CompactArchive: The archive, or None
+
+    '''
+    global _compactArchive
+    _compactArchive = None
+    _frameCache.clear()
+    if encoding is None:
+        return None
+
+    archive = CompactArchive(encoding)
+    store = get_metrics_store()
+    if store is not None:
+        for start in range(0, len(store), chunksize):
+            rows = range(start, min(start + chunksize, len(store)))
+            archive.append(store.keys[rows.start:rows.stop], store.take(rows),
+                           store.filenames[rows.start:rows.stop])
+    else:
+        catalog = get_metrics_catalog()
+        keys = catalog.select()
+        for start in range(0, len(keys), chunksize):
+            found, values = load_many_values(keys[start:start + chunksize], nprocs)
+            archive.append(found, values, [catalog.get_filename(key) for key in found])
+    _frameCache.clear()
+
+    print('Compact archive ({0}): {1} cases in {2:.1f} MB instead of {3:.1f} MB, max relative error {4:.3g}'.format(
+        encoding, len(archive), archive.nbytes / 1024**2,
+        len(archive) * len(REMAPITERATIONS) * len(METRICSNAMES) * 8 / 1024**2, archive.max_relative_error))
+    _compactArchive = archive
+    return archive
+
+
+def set_compact_archive(archive):
+    '''
+    Make the loaders use an archive previously built with configure_compact_archive,
+    or none with archive=None, without rebuilding it
+    '''
+    global _compactArchive
+    if archive is not _compactArchive:
+        _frameCache.clear()
+    _compactArchive = archive
+
+
+def get_compact_archive():
+    '''
+    Return the compact in-memory archive if it has been configured, else None
+    '''
+    return _compactArchive
+
+
+def get_decompressed_file(filename):
+    '''
+    Return a decompressed copy of a .csv.bz2 dataset from the
+    DECOMPRESSED_CACHE_DIRECTORY under MetricsStorePath,
+    decompressing it on first use. A copy is refreshed whenever the size or
+    modification time of the compressed source changes. Other files are
+    returned unchanged.
+    '''
+    if not (USE_DECOMPRESSED_CACHE and filename.endswith('.bz2')):
+        return filename
+
+    cachedfile = os.path.join(get_store_directory(DECOMPRESSED_CACHE_DIRECTORY),
+                              os.path.relpath(filename, MetricsFilePath)[:-len('.bz2')])
+    sourcestat = os.stat(filename)
+    stamp = '{0} {1}'.format(sourcestat.st_size, sourcestat.st_mtime_ns)
+    stampfile = cachedfile + '.stamp'
+    if os.path.exists(cachedfile) and os.path.exists(stampfile):
+        with open(stampfile, 'r') as fstamp:
+            if fstamp.read() == stamp:
+                return cachedfile
+
+    os.makedirs(os.path.dirname(cachedfile), exist_ok=True)
+    with stage('decompress') as timer:
+        with bz2.open(filename, 'rb') as fsource, open(cachedfile + '.tmp', 'wb') as fcached:
+            shutil.copyfileobj(fsource, fcached)
+            timer.nbytes = fcached.tell()
+    os.replace(cachedfile + '.tmp', cachedfile)
+    with open(stampfile, 'w') as fstamp:
+        fstamp.write(stamp)
+    return cachedfile
+
+
+def load_dataset(key):
+    '''
+    Return the (dataframe, filename) pair for a case key. Recently loaded datasets
+    are served from the in-memory cache; otherwise the compact archive is decoded
+    or the consolidated store is sliced when available, and the (decompressed)
+    dataset file is read as a last resort.
+    '''
+    with stage('cache'):
+        data, filename = _frameCache.get(key)
+    if data is not None:
+        return data, filename
+
+    if _compactArchive is not None:
+        with stage('compact'):
+            data, filename = _compactArchive.get(key)
+
+    store = get_metrics_store()
+    if data is None and store is not None:
+        with stage('store'):
+            data, filename = store.get(key)
+
+    if data is None:
+        with stage('resolve'):
+            filename = get_metrics_catalog().get_filename(key)
+        if not filename:
+            print('Could not find dataset ', key)
+            return None, ""
+        data = read_metrics_file(get_decompressed_file(filename))
+
+    _frameCache.put(key, data, filename)
+    return data, filename
+
+
+def get_supported_orders(iMETHOD):
+    '''
+    Return the orders of a method: those of SUPPORTED_ORDERS and any other order
+    found in the catalog, e.g. of newly ingested datasets
+    '''
+    catalog = get_metrics_catalog()
+    return sorted(set(SUPPORTED_ORDERS[iMETHOD]) | set(catalog.available('order', method=METHODS[iMETHOD])))
+
+
+def _check_dataset_arguments(iMETHOD, iSRC, iTGT, iVARin, Order, subPath, nresolutions):
+    '''
+    Raise ValueError for arguments of get_dataset and get_rrm_dataset that select no dataset
+    '''
+    if not 0 <= iMETHOD < NMETHODS:
+        raise ValueError('iMETHOD must be in 0-{0}, got {1}'.format(NMETHODS - 1, iMETHOD))
+    for name, index in [('iSRC', iSRC), ('iTGT', iTGT)]:
+        if not 0 <= index < nresolutions:
+            raise ValueError('{0} must be in 0-{1}, got {2}'.format(name, nresolutions - 1, index))
+    if not 0 <= iVARin < len(DATAVARIABLES):
+        raise ValueError('iVARin must be in 0-{0}, got {1}'.format(len(DATAVARIABLES) - 1, iVARin))
+    if Order not in SUPPORTED_ORDERS[iMETHOD]:
+        orders = get_supported_orders(iMETHOD)
+        if Order not in orders:
+            raise ValueError('Order {0} is not available for {1}, the orders are {2}'.format(
+                Order, METHODS[iMETHOD], orders))
+    if iMETHOD == 1 and subPath not in [0, 1]:
+        raise ValueError('GMLS datasets are selected with subPath 0 (plain) or 1 (CAAS), got {0}'.format(subPath))
+
+
+def get_dataset(iMETHOD, GridType, iSRC, iTGT, iVARin, Order, subPath=-1):
+    '''
+    For a given remap method, src/tgt res, variable and order, return dataset
+
+    Parameters:
+    argument1 (int): Description of arg1
+    iMETHOD (int): Parameter ranging from 0-3. 0: TempestRemap, 1: GMLS, 2: WLS-ENOR, 3: ESMF
+    GridType (int): Parameter ranging from 0-2. 0: CS-ICOD, 1: ICOD-RLL, 2: RLL-CS
+    iSRC (int): Parameter ranging from 0-4 indicating the source grid resolution in the grid combo
+    iTGT (int): Parameter ranging from 0-4 indicating the target grid resolution in the grid combo
+    iVARin (int): Parameter ranging between 0-4 indicating analytical and real sampled fields
+    Order (int): Order of the method (iMETHOD)
+    subPath (int): If a method has variations of datasets with different properties, expose through a sub-path. Default: -1 (None).
+
+    Returns:
+    pandas dataframe: The dataframe containing the metrics data in a Pandas dataframe object
+    string: The filename of the dataset that is currently loaded onto the dataframe
+
+    '''
+    if not 0 <= GridType < NDATASETS:
+        raise ValueError('GridType must be in 0-{0}, got {1}'.format(NDATASETS - 1, GridType))
+    _check_dataset_arguments(iMETHOD, iSRC, iTGT, iVARin, Order, subPath, NRESOLUTIONS)
+
+    data, filename = load_dataset(get_dataset_key(
+        iMETHOD, GridType, iSRC, iTGT, iVARin, Order, subPath))
+
+    if data is None:
+        print('Unable to get dataset. Returning...')
+
+    return data, filename
+
+
+def get_rrm_dataset(iMETHOD, iSRC, iTGT, iVARin, Order, subPath=-1):
+    '''
+    For a given remap method, src/tgt res, variable and order, return dataset
+
+    Parameters:
+    argument1 (int): Description of arg1
+    iMETHOD (int): Parameter ranging from 0-3. 0: TempestRemap, 1: GMLS, 2: WLS-ENOR, 3: ESMF
+    GridType (int): Parameter ranging from 0-2. 0: CS-ICOD, 1: ICOD-RLL, 2: RLL-CS
+    iSRC (int): Parameter ranging from 0-4 indicating the source grid resolution in the grid combo
+    iTGT (int): Parameter ranging from 0-4 indicating the target grid resolution in the grid combo
+    iVARin (int): Parameter ranging between 0-4 indicating analytical and real sampled fields
+    Order (int): Order of the method (iMETHOD)
+    subPath (int): If a method has variations of datasets with different properties, expose through a sub-path. Default: -1 (None).
+
+    Returns:
+    pandas dataframe: The dataframe containing the metrics data in a Pandas dataframe object
+    string: The filename of the dataset that is currently loaded onto the dataframe
+
+    '''
+    _check_dataset_arguments(iMETHOD, iSRC, iTGT, iVARin, Order, subPath, NRRMRESOLUTIONS)
+
+    data, filename = load_dataset(get_dataset_key(
+        iMETHOD, 0, iSRC, iTGT, iVARin, Order, subPath, isRRM=True))
+
+    # print("Reading filename: %s"%filename)
+    return data, filename
+
+
+def build_sweep(methods=METHOD_VARIATIONS, gridtypes=None, resolutions=None,
+                variables=None, orders=None, isRRM=False):
+    '''
+    Build the list of dataset cases for a parameter sweep
+
+    Parameters:
+    methods (list): (iMETHOD, subPath) pairs of the method variations. Default: METHOD_VARIATIONS
+    gridtypes (list): Grid combos to include. Default: all of GRIDTYPES (ignored for RRM)
+    resolutions (list): (iSRC, iTGT) pairs. Default: all pairs of CSRES/ICODRES/RLLRES (or RRM) resolutions
+    variables (list): Indices into DATAVARIABLES. Default: all variables
+    orders (list): Orders to include when supported by a method. Default: all orders of
+                   get_supported_orders
+    isRRM (bool): Build the sweep over the regionally refined cases
+
+    Returns:
+    list: (iMETHOD, GridType, iSRC, iTGT, iVARin, Order, subPath) tuples as accepted by load_many
+
+    '''
+    nresolutions = NRRMRESOLUTIONS if isRRM else NRESOLUTIONS
+    if gridtypes is None or isRRM:
+        gridtypes = [0] if isRRM else range(len(GRIDTYPES))
+    if resolutions is None:
+        resolutions = [(isrc, itgt) for isrc in range(nresolutions) for itgt in range(nresolutions)]
+    if variables is None:
+        variables = range(len(DATAVARIABLES))
+
+    cases = []
+    for iMETHOD, subPath in methods:
+        for Order in get_supported_orders(iMETHOD):
+            if orders is not None and Order not in orders:
+                continue
+            for ivar in variables:
+                for gridtype in gridtypes:
+                    for isrc, itgt in resolutions:
+                        cases.append((iMETHOD, gridtype, isrc, itgt, ivar, Order, subPath))
+    return cases
+
+
+def _load_dataset_values(keys):
+    '''
+    Worker for load_many: return the metrics array for each case key (None if missing)
+    '''
+    values = []
+    for key in keys:
+        data, filename = load_dataset(key)
+        values.append(None if data is None else data.to_numpy(dtype=np.float64))
+    return values
+
+
+def _get_worker_settings():
+    '''
+    Return the settings of the loaders that load_many workers need, which
+    processes started with spawn or forkserver would not inherit
+    '''
+    return {'MetricsFilePath': MetricsFilePath, 'MetricsStorePath': MetricsStorePath,
+            'USE_METRICS_STORE': USE_METRICS_STORE, 'USE_DECOMPRESSED_CACHE': USE_DECOMPRESSED_CACHE}
+
+
+def _configure_worker(settings):
+    '''
+    Initializer of the load_many workers: apply the settings of the parent process
+    '''
+    globals().update(settings)
+
+
+def load_many_values(keys, nprocs=None, chunksize=64):
+    '''
+    Load the metrics of many case keys at once, see load_many
+
+    Returns:
+    list: The case keys that were found
+    numpy array: The metrics of the found cases with shape (len(keys), iterations, metrics)
+
+    '''
+    if nprocs is None:
+        nprocs = os.cpu_count() or 1
+    # Decoding the compact archive or slicing the memory-mapped store is cheaper
+    # than handing cases to workers
+    if (_compactArchive is not None or get_metrics_store() is not None or
+            nprocs <= 1 or len(keys) <= chunksize):
+        values = _load_dataset_values(keys)
+    else:
+        import concurrent.futures
+        # Scan (or load) the catalog once here so that the workers do not each
+        # scan MetricsData and write the manifest concurrently
+        get_metrics_catalog()
+        chunks = [keys[i:i + chunksize] for i in range(0, len(keys), chunksize)]
+        values = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=nprocs, initializer=_configure_worker,
+                                                    initargs=(_get_worker_settings(),)) as executor:
+            for chunkvalues in executor.map(_load_dataset_values, chunks):
+                values.extend(chunkvalues)
+
+    found = [(key, value) for key, value in zip(keys, values) if value is not None]
+    if len(found) < len(keys):
+        print('Could not load {0} of {1} datasets'.format(len(keys) - len(found), len(keys)))
+    if not found:
+        return [], np.empty((0, len(REMAPITERATIONS), len(METRICSNAMES)))
+    return [key for key, value in found], np.stack([value for key, value in found])
+
+
+def load_many(cases, isRRM=False, nprocs=None, chunksize=64):
+    '''
+    Load the datasets for many cases at once into a single dataframe
+
+    Parameters:
+    cases (iterable): (iMETHOD, GridType, iSRC, iTGT, iVARin, Order, subPath) tuples, e.g. from build_sweep
+    isRRM (bool): Whether the cases refer to the regionally refined datasets (GridType is ignored)
+    nprocs (int): Number of worker processes used to decompress and parse the CSV files.
+                  Default: os.cpu_count(). Not used when the consolidated store is available.
+    chunksize (int): Number of cases handed to a worker at a time
+
+    Returns:
+    pandas dataframe: The metrics of all cases found, with METRICSNAMES columns and a
+                      MultiIndex of the STORE_DIMENSIONS plus the remap iteration
+
+    '''
+    keys = []
+    for iMETHOD, GridType, iSRC, iTGT, iVARin, Order, subPath in cases:
+        keys.append(get_dataset_key(iMETHOD, GridType, iSRC, iTGT, iVARin, Order, subPath, isRRM=isRRM))
+
+    found, values = load_many_values(keys, nprocs, chunksize)
+
+    niterations = len(REMAPITERATIONS)
+    levels = [np.repeat([key[idim] for key in found], niterations)
+              for idim in range(len(STORE_DIMENSIONS))]
+    levels.append(np.tile(REMAPITERATIONS, len(found)))
+    index = pd.MultiIndex.from_arrays(levels, names=STORE_DIMENSIONS + ['iteration'])
+    return pd.DataFrame(values.reshape(-1, len(METRICSNAMES)), index=index, columns=METRICSNAMES)
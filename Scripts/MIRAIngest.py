@@ -0,0 +1,129 @@
+'''
+Incremental ingestion of new metrics datasets into the MIRA archive.
+
+New or changed metrics_*.csv(.bz2) files dropped into MetricsData/ are
+validated against the METRICSNAMES header and the REMAPITERATIONS layout, added
+to the catalog, appended to the consolidated store as a new segment (when the
+store has been built) and the summary tables of the affected groups are
+recomputed (when they have been written), without rebuilding anything from
+scratch. Without arguments, the files that are not in the catalog or were
+modified since it was last written are ingested.
+
+Usage:
+python MIRAIngest.py [FILE_OR_DIRECTORY ...] [--check]
+'''
+import os
+import sys
+import argparse
+
+import MIRADatasets
+from MIRADatasets import (METRICSCATALOG_FILE, get_metrics_catalog, get_metrics_store, parse_metrics_filename,
+                          update_metrics_catalog, validate_metrics_file, append_metrics_store)
+from MIRASummary import (SUMMARY_TABLES, get_summary_path, read_summary_tables, update_summary_tables,
+                         write_summary_tables)
+
+
+def find_new_metrics_files(paths=None):
+    '''
+    Return the metrics datasets (relative to MetricsFilePath) under the given
+    files or directories, by default MetricsFilePath, that are not in the
+    catalog or were modified after the catalog was written
+    '''
+    catalog = get_metrics_catalog()
+    metricspath = MIRADatasets.MetricsFilePath
+    catalogfile = os.path.join(MIRADatasets.MetricsStorePath, METRICSCATALOG_FILE)
+    catalogtime = os.path.getmtime(catalogfile) if os.path.exists(catalogfile) else 0.0
+    catalogued = set(catalog.files.values())
+
+    filenames = []
+    for path in (paths or [metricspath]):
+        if os.path.isdir(path):
+            for dirpath, dirnames, names in os.walk(path):
+                dirnames.sort()
+                filenames.extend(os.path.join(dirpath, name) for name in sorted(names))
+        else:
+            filenames.append(path)
+
+    relpaths = []
+    for filename in filenames:
+        relpath = os.path.relpath(os.path.abspath(filename), os.path.abspath(metricspath))
+        if relpath.startswith('..'):
+            print('Skipping {0}: datasets must be placed under {1}'.format(filename, metricspath))
+            continue
+        if not (relpath.endswith('.csv') or relpath.endswith('.csv.bz2')):
+            continue
+        # The catalog uses the compressed copy when both exist
+        if relpath + '.bz2' in catalogued:
+            continue
+        if relpath not in catalogued or os.path.getmtime(filename) > catalogtime:
+            relpaths.append(relpath)
+    return relpaths
+
+
+def validate_metrics_files(relpaths):
+    '''
+    Validate the filenames and contents of metrics datasets
+
+    Returns:
+    list: The valid datasets
+    dict: The problems of each invalid dataset
+
+    '''
+    valid, invalid = [], {}
+    for relpath in relpaths:
+        key = parse_metrics_filename(relpath)
+        if key is None:
+            invalid[relpath] = ['filename does not follow the metrics dataset naming']
+            continue
+        problems = validate_metrics_file(MIRADatasets.MetricsFilePath + relpath)
+        if problems:
+            invalid[relpath] = problems
+            continue
+        valid.append(relpath)
+    return valid, invalid
+
+
+def ingest_metrics_files(relpaths, summarypath=None):
+    '''
+    Add validated datasets to the catalog, the consolidated store and the summary
+    tables in summarypath (default: get_summary_path())
+
+    Returns:
+    list: The case keys of the ingested datasets
+
+    '''
+    keys = update_metrics_catalog(relpaths)
+    print('Added {0} datasets to the catalog'.format(len(keys)))
+
+    if get_metrics_store() is not None:
+        append_metrics_store(keys)
+
+    if summarypath is None:
+        summarypath = get_summary_path()
+    if all(os.path.exists(os.path.join(summarypath, name + '.csv')) for name in SUMMARY_TABLES):
+        tables = update_summary_tables(read_summary_tables(summarypath), keys)
+        write_summary_tables(tables, summarypath)
+        print('Updated the summary tables in ', summarypath)
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest new metrics datasets into the MIRA archive')
+    parser.add_argument('paths', nargs='*', help='Files or directories under MetricsData. Default: all new files')
+    parser.add_argument('--check', action='store_true', help='Only validate the new files')
+    parser.add_argument('--summary', default=get_summary_path(), help='Directory of the summary tables to update')
+    args = parser.parse_args()
+
+    relpaths = find_new_metrics_files(args.paths)
+    valid, invalid = validate_metrics_files(relpaths)
+    for relpath, problems in invalid.items():
+        print('Invalid dataset {0}: {1}'.format(relpath, '; '.join(problems)))
+    print('{0} new datasets, {1} valid'.format(len(relpaths), len(valid)))
+
+    if valid and not args.check:
+        ingest_metrics_files(valid, args.summary)
+    return 1 if invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+'''
+Lazy access to the meshes and sampled reference fields under Meshes/.
+
+The NetCDF files are opened without reading their data: fields are read one
+variable (or one slice of elements) at a time, and the element counts, cell
+areas and cell centers are derived from the mesh connectivity on demand. Files
+are opened with netCDF4 when it is installed, and otherwise memory-mapped with
+scipy.io.netcdf_file, so the largest meshes (RLL 720x1440 and ICOD256) can be
+processed in chunks without loading them into memory.
+
+    with open_mesh('RLL', 4) as mesh:
+        print(mesh.nelements, mesh.integrate_field('TotalPrecipWater'))
+
+The mesh files are stored with Git LFS; run "git lfs pull" to fetch them.
+'''
+import os
+
+import numpy as np
+
+from MIRADatasets import CSRES, ICODRES, RLLRES, DATAVARIABLES
+from MIRAProfiling import stage
+
+MeshFilePath = '../Meshes/'
+
+# Mesh files of the uniformly and regionally refined grids, by grid and resolution index
+MESHFILES = {'CS': ['UniformlyRefined/CS/sample_NM16_O10_CS-r%s_TPW_CFR_TPO_A1_A2.nc' % res for res in CSRES],
+             'ICOD': ['UniformlyRefined/ICOD/sample_NM16_O10_ICOD-r%s_TPW_CFR_TPO_A1_A2.nc' % res for res in ICODRES],
+             'RLL': ['UniformlyRefined/RLL/sample_NM16_O10_RLL-r%s_TPW_CFR_TPO_A1_A2.nc' % res for res in RLLRES]}
+RRM_MESHFILES = {'CS': ['RegionallyRefined/CS/sample_NM32_O18_r%s_tr_enhanced_TPW_CFR_TPO_A1_A2.nc' % res
+                        for res in ['32_lev1', '64_lev2', '128_lev1']],
+                 'MPAS': ['RegionallyRefined/MPAS/sample_NM32_O18_mpas_r%s_enhanced_TPW_CFR_TPO_A1_A2.nc' % res
+                          for res in ['3', '4', '5']]}
+
+# Number of elements processed at a time when reading fields and computing geometry
+CHUNK_ELEMENTS = 262144
+
+LFS_POINTER_HEADER = b'version https://git-lfs'
+
+
+def get_mesh_filename(GridType, iRES, isRRM=False):
+    '''
+    Return the mesh filename of a grid at a resolution
+
+    Parameters:
+    GridType (string): 'CS', 'ICOD' or 'RLL' for the uniformly refined meshes, 'CS' or 'MPAS' for RRM
+    iRES (int): Index of the resolution
+    isRRM (bool): Regionally refined mesh
+
+    Returns:
+    string: The filename of the mesh
+
+    '''
+    meshfiles = RRM_MESHFILES if isRRM else MESHFILES
+    assert(GridType in meshfiles), 'Unknown grid type: ' + str(GridType)
+    assert(iRES >= 0 and iRES < len(meshfiles[GridType]))
+    return os.path.join(MeshFilePath, meshfiles[GridType][iRES])
+
+
+def _open_netcdf(filename):
+    '''
+    Open a NetCDF file for reading without loading its variables
+    '''
+    with open(filename, 'rb') as fmesh:
+        if fmesh.read(len(LFS_POINTER_HEADER)) == LFS_POINTER_HEADER:
+            raise IOError('{0} is a Git LFS pointer; fetch the mesh files with "git lfs pull"'.format(filename))
+    try:
+        import netCDF4
+    except ImportError:
+        from scipy.io import netcdf_file
+        return netcdf_file(filename, 'r', mmap=True)
+    dataset = netCDF4.Dataset(filename, 'r')
+    dataset.set_auto_mask(False)
+    return dataset
+
+
+def _spherical_triangle_areas(a, b, c):
+    '''
+    Areas of the spherical triangles with unit vertex vectors a, b and c (Van Oosterom-Strackee)
+    '''
+    numerator = np.abs(np.einsum('ij,ij->i', a, np.cross(b, c)))
+    denominator = 1.0 + np.einsum('ij,ij->i', a, b) + np.einsum('ij,ij->i', b, c) + np.einsum('ij,ij->i', c, a)
+    return 2.0 * np.arctan2(numerator, denominator)
+
+
+class MeshFile:
+    '''
+    A mesh file with its sampled fields, opened lazily. Exodus meshes (coord or
+    coordx/coordy/coordz with connect1) and MPAS meshes (xVertex/yVertex/zVertex
+    with verticesOnCell) are supported.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.dataset = _open_netcdf(filename)
+        self._areas = None
+        self._centers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self.dataset is not None:
+            self.dataset.close()
+            self.dataset = None
+
+    @property
+    def variables(self):
+        return list(self.dataset.variables)
+
+    @property
+    def fields(self):
+        '''
+        The sampled reference fields available in the file
+        '''
+        return [name for name in DATAVARIABLES if name in self.dataset.variables]
+
+    def _dimension(self, name):
+        dimension = self.dataset.dimensions.get(name)
+        if dimension is None or isinstance(dimension, int):
+            return dimension
+        return len(dimension)
+
+    @property
+    def nelements(self):
+        '''
+        The number of elements, read from the file header
+        '''
+        for name in ['num_elem', 'nCells', 'grid_size', 'ncol']:
+            size = self._dimension(name)
+            if size is not None:
+                return size
+        fields = self.fields
+        assert(fields), 'Cannot determine the number of elements of ' + self.filename
+        return self.dataset.variables[fields[0]].shape[-1]
+
+    def read_field(self, name, start=0, stop=None):
+        '''
+        Read the elements [start, stop) of a field (by default all of them).
+        Only this slice is read from the file; leading singleton dimensions
+        such as time are dropped.
+        '''
+        variable = self.dataset.variables[name]
+        index = (0,) * (len(variable.shape) - 1) + (slice(start, stop),)
+        with stage('mesh_read') as timing:
+            values = np.array(variable[index], dtype=np.float64)
+            timing.nbytes = values.nbytes
+        return values
+
+    def iter_field(self, name, chunksize=CHUNK_ELEMENTS):
+        '''
+        Iterate over a field in chunks of elements, yielding (start, values)
+        '''
+        nelements = self.dataset.variables[name].shape[-1]
+        for start in range(0, nelements, chunksize):
+            yield start, self.read_field(name, start, min(start + chunksize, nelements))
+
+    def _vertices(self):
+        '''
+        Return the unit vectors of the mesh vertices and the connectivity variable
+        with 1-based vertex indices (padded entries are 0)
+        '''
+        variables = self.dataset.variables
+        if 'connect1' in variables:
+            if 'coord' in variables:
+                coords = np.array(variables['coord'][:], dtype=np.float64).T
+            else:
+                coords = np.stack([np.array(variables[name][:], dtype=np.float64)
+                                   for name in ['coordx', 'coordy', 'coordz']], axis=1)
+            connectivity = variables['connect1']
+        elif 'verticesOnCell' in variables:
+            coords = np.stack([np.array(variables[name][:], dtype=np.float64)
+                               for name in ['xVertex', 'yVertex', 'zVertex']], axis=1)
+            connectivity = variables['verticesOnCell']
+        else:
+            raise ValueError('No mesh connectivity found in ' + self.filename)
+        coords /= np.linalg.norm(coords, axis=1)[:, None]
+        return coords, connectivity
+
+    def _compute_geometry(self, chunksize=CHUNK_ELEMENTS):
+        with stage('mesh_geometry'):
+            coords, connectivity = self._vertices()
+            nelements = connectivity.shape[0]
+            areas = np.empty(nelements)
+            centers = np.empty((nelements, 3))
+            for start in range(0, nelements, chunksize):
+                stop = min(start + chunksize, nelements)
+                cells = np.array(connectivity[start:stop], dtype=np.int64)
+                # Padded entries repeat the first vertex, giving degenerate triangles
+                cells = np.where(cells > 0, cells, cells[:, :1]) - 1
+                vertices = coords[cells]
+                chunkareas = np.zeros(stop - start)
+                for ivertex in range(1, cells.shape[1] - 1):
+                    chunkareas += _spherical_triangle_areas(vertices[:, 0], vertices[:, ivertex], vertices[:, ivertex + 1])
+                areas[start:stop] = chunkareas
+                center = vertices.sum(axis=1)
+                centers[start:stop] = center / np.linalg.norm(center, axis=1)[:, None]
+        self._areas, self._centers = areas, centers
+
+    def cell_areas(self):
+        '''
+        Return the areas of the elements on the unit sphere, computed on first use
+        '''
+        if self._areas is None:
+            self._compute_geometry()
+        return self._areas
+
+    def cell_centers(self):
+        '''
+        Return the unit vectors of the element centers, computed on first use
+        '''
+        if self._centers is None:
+            self._compute_geometry()
+        return self._centers
+
+    def integrate_field(self, name, chunksize=CHUNK_ELEMENTS):
+        '''
+        Return the area-weighted integral of a field over the unit sphere, read in chunks
+        '''
+        areas = self.cell_areas()
+        integral = 0.0
+        for start, values in self.iter_field(name, chunksize):
+            integral += np.dot(areas[start:start + len(values)], values)
+        return integral
+
+
+def open_mesh(GridType, iRES, isRRM=False):
+    '''
+    Open the mesh file of a grid at a resolution, see get_mesh_filename
+    '''
+    return MeshFile(get_mesh_filename(GridType, iRES, isRRM))
+
+
+def get_mesh_elements(GridType, isRRM=False):
+    '''
+    Return the number of elements of a grid at each resolution, read from the mesh files
+    '''
+    elements = []
+    for iRES in range(len((RRM_MESHFILES if isRRM else MESHFILES)[GridType])):
+        with open_mesh(GridType, iRES, isRRM) as mesh:
+            elements.append(mesh.nelements)
+    return elements
@@ -0,0 +1,179 @@
+'''
+Per-stage timing hooks for the MIRA data and plotting pipeline.
+
+The loaders and plotting functions wrap each stage of their work (dataset
+lookup, file read, decompression, CSV parse, dataframe copies, figure
+construction and image export) in stage(name). When listeners are registered
+every stage reports its name, duration and the number of bytes it processed;
+without listeners the hooks do nothing.
+
+    with profile_stages(cprofile=True) as profile:
+        plot_dataset(...)
+    print(profile.summary())
+    profile.dump_stats('plot.prof')
+
+Setting the MIRA_PROFILE environment variable to a filename profiles the whole
+process instead: a stage summary is printed to stderr at exit and the cProfile
+statistics are written to that file, without editing the script being run.
+'''
+import os
+import sys
+import time
+import atexit
+import cProfile
+
+_listeners = []
+
+
+class _Stage:
+    '''
+    Context manager timing one stage and notifying the listeners on exit.
+    The bytes processed by the stage can be set on the nbytes attribute.
+    '''
+    __slots__ = ('name', 'nbytes', 'start')
+
+    def __init__(self, name, nbytes):
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        for listener in list(_listeners):
+            listener(self.name, elapsed, self.nbytes)
+        return False
+
+
+class _NullStage:
+    '''
+    Shared no-op stage used while no listeners are registered
+    '''
+    nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_nullStage = _NullStage()
+
+
+def stage(name, nbytes=0):
+    '''
+    Return a context manager timing the stage name of the pipeline
+    '''
+    if not _listeners:
+        return _nullStage
+    return _Stage(name, nbytes)
+
+
+def add_stage_listener(listener):
+    '''
+    Register a callback listener(name, seconds, nbytes) called at the end of every stage
+    '''
+    _listeners.append(listener)
+
+
+def remove_stage_listener(listener):
+    _listeners.remove(listener)
+
+
+class StageProfile:
+    '''
+    Stage listener accumulating the number of calls, the time and the bytes of each stage
+    '''
+
+    def __init__(self, cprofile=False):
+        self.stages = {}
+        self.profiler = cProfile.Profile() if cprofile else None
+
+    def __call__(self, name, seconds, nbytes):
+        calls, total, longest, totalbytes = self.stages.get(name, (0, 0.0, 0.0, 0))
+        self.stages[name] = (calls + 1, total + seconds, max(longest, seconds), totalbytes + nbytes)
+
+    def start(self):
+        add_stage_listener(self)
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        remove_stage_listener(self)
+
+    def to_dict(self):
+        return {name: {'calls': calls, 'seconds': total, 'max_seconds': longest, 'bytes': nbytes}
+                for name, (calls, total, longest, nbytes) in self.stages.items()}
+
+    def summary(self):
+        '''
+        Return a table of the stages sorted by their total time
+        '''
+        lines = ['{0:<16} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10}'.format(
+            'stage', 'calls', 'total [s]', 'mean [ms]', 'max [ms]', 'MB')]
+        for name, (calls, total, longest, nbytes) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            lines.append('{0:<16} {1:>8d} {2:>10.3f} {3:>10.3f} {4:>10.3f} {5:>10.2f}'.format(
+                name, calls, total, total / calls * 1e3, longest * 1e3, nbytes / 1024**2))
+        return '\n'.join(lines)
+
+    def dump_stats(self, filename):
+        '''
+        Write the cProfile statistics (readable with pstats or snakeviz) to filename
+        '''
+        assert(self.profiler is not None), 'Profile the stages with cprofile=True to dump statistics'
+        self.profiler.dump_stats(filename)
+
+
+class profile_stages:
+    '''
+    Context manager collecting a StageProfile over a block of code, optionally
+    running cProfile over the same block
+    '''
+
+    def __init__(self, cprofile=False):
+        self.profile = StageProfile(cprofile)
+
+    def __enter__(self):
+        self.profile.start()
+        return self.profile
+
+    def __exit__(self, *exc):
+        self.profile.stop()
+        return False
+
+
+def latency_summary(latencies):
+    '''
+    Return the mean and percentiles of a list of latencies in seconds
+    '''
+    import numpy as np
+    latencies = np.asarray(latencies)
+    if len(latencies) == 0:
+        return {}
+    return {'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p90': float(np.percentile(latencies, 90)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max())}
+
+
+def _profile_process(filename):
+    profile = StageProfile(cprofile=True)
+    profile.start()
+
+    def report():
+        profile.stop()
+        print(profile.summary(), file=sys.stderr)
+        profile.dump_stats(filename)
+        print('Wrote profile statistics to ', filename, file=sys.stderr)
+
+    atexit.register(report)
+
+
+if os.environ.get('MIRA_PROFILE'):
+    _profile_process(os.environ['MIRA_PROFILE'])
@@ -0,0 +1,214 @@
+'''
+Resolution-normalized comparison of the regionally refined (RRM) cases with
+the uniformly refined ones.
+
+The RRM datasets remap from refined CS meshes to refined MPAS meshes, so they
+are compared with the CS-MPAS uniform cases of the same method, order and
+variable. Every mesh is mapped onto an effective resolution, the mean spacing
+of a uniform mesh with the same number of elements (see get_mesh_spacing), and
+the uniform metrics are interpolated at the effective source and target
+spacings of each RRM case, bilinearly in log10|metric| against log10(h) over
+the uniform resolution pairs. The ratio of the RRM metric to the interpolated
+uniform one is the penalty (> 1) or benefit (< 1) of regional refinement at
+the same element count. All cases are loaded once and interpolated together.
+
+Usage:
+python MIRARRM.py [--output ../MetricsStore/rrm/] [--metrics GL2 GLinf] [--iterations 1000]
+'''
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from MIRADatasets import (NRESOLUTIONS, GRIDTYPES, METRICSNAMES, REMAPITERATIONS, STORE_DIMENSIONS,
+                          RRMCSELEMS, RRMICODELEMS,
+                          get_store_directory, get_metrics_catalog, load_many_values)
+from MIRAConvergence import get_mesh_spacing, get_grid_spacings
+
+# Directory of the comparison tables under MetricsStorePath
+RRM_COMPARISON_DIRECTORY = 'rrm'
+
+# Uniformly refined grid combo matching the RRM source and target meshes
+RRM_UNIFORM_GRID = 'CS-MPAS'
+
+# Columns identifying the uniform counterparts of an RRM case and a method variation
+RRM_GROUP = ['method', 'subtype', 'variable', 'order']
+RRM_METHOD = ['method', 'subtype', 'order']
+
+RRM_TABLES = ['rrm_comparison', 'rrm_penalty']
+
+_RRM_GROUP_INDICES = [STORE_DIMENSIONS.index(dim) for dim in RRM_GROUP]
+
+
+def get_rrm_group(key):
+    '''
+    Return the values of the RRM_GROUP dimensions of a case key, shared by an
+    RRM case and its uniformly refined counterparts
+    '''
+    return tuple(key[idim] for idim in _RRM_GROUP_INDICES)
+
+
+def get_rrm_spacings():
+    '''
+    Return the effective (mean) spacing of the RRM source (CS) and target (MPAS)
+    meshes for each of the RRM resolutions
+    '''
+    return get_mesh_spacing(RRMCSELEMS), get_mesh_spacing(RRMICODELEMS)
+
+
+def get_interpolation_weights(h, gridh):
+    '''
+    Return the interval and weight of the linear interpolation in log10(h)
+    between the mesh spacings gridh (from coarse to fine) at the spacings h
+
+    Returns:
+    numpy array: Index of the coarser end of the interval of each spacing
+    numpy array: Weight of the finer end of the interval
+    numpy array: Whether each spacing lies outside gridh (extrapolated)
+
+    '''
+    x = -np.log10(np.asarray(gridh))
+    xi = -np.log10(np.asarray(h))
+    lower = np.clip(np.searchsorted(x, xi, side='right') - 1, 0, len(x) - 2)
+    weight = (xi - x[lower]) / (x[lower + 1] - x[lower])
+    return lower, weight, (weight < 0.0) | (weight > 1.0)
+
+
+def interpolate_uniform(uniform, groups, hsrc, htgt):
+    '''
+    Interpolate uniform metrics at effective source and target spacings,
+    bilinearly in log10|metric| against log10(h). Zero or missing uniform
+    values at the corners of an interpolation cell give NaN.
+
+    Parameters:
+    uniform (numpy array): Metrics of shape (groups, NRESOLUTIONS, NRESOLUTIONS, ...)
+                           over the source and target resolutions of RRM_UNIFORM_GRID
+    groups (numpy array): Group of each interpolated case
+    hsrc (numpy array): Effective source spacing of each case
+    htgt (numpy array): Effective target spacing of each case
+
+    Returns:
+    numpy array: Interpolated magnitudes of shape (cases, ...)
+    numpy array: Whether the spacings of each case lie outside the uniform resolutions
+
+    '''
+    gridsrc, gridtgt = get_grid_spacings(GRIDTYPES.index(RRM_UNIFORM_GRID))
+    isrc, wsrc, outsrc = get_interpolation_weights(hsrc, gridsrc)
+    itgt, wtgt, outtgt = get_interpolation_weights(htgt, gridtgt)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log10(np.abs(uniform))
+    logs[~np.isfinite(logs)] = np.nan
+
+    expand = (slice(None),) + (None,) * (uniform.ndim - 3)
+    wsrc, wtgt = wsrc[expand], wtgt[expand]
+    interpolated = ((1.0 - wsrc) * (1.0 - wtgt) * logs[groups, isrc, itgt] +
+                    wsrc * (1.0 - wtgt) * logs[groups, isrc + 1, itgt] +
+                    (1.0 - wsrc) * wtgt * logs[groups, isrc, itgt + 1] +
+                    wsrc * wtgt * logs[groups, isrc + 1, itgt + 1])
+    return 10.0 ** interpolated, outsrc | outtgt
+
+
+def compare_rrm_uniform(metrics=METRICSNAMES, iterations=None, nprocs=None, **criteria):
+    '''
+    Compare every RRM case with its uniformly refined counterparts interpolated
+    at the effective resolutions of the RRM meshes
+
+    Parameters:
+    metrics (list): Metrics to compare. Default: all METRICSNAMES
+    iterations (list): Remap iterations to compare. Default: the final one
+    nprocs (int): Number of worker processes for loading the datasets, see load_many
+    criteria: Dimension values selecting the RRM cases, e.g. method='GMLS', variable='Topography'
+
+    Returns:
+    pandas dataframe: One row per RRM case, iteration and metric with the effective
+                      source and target spacings, the RRM value, the interpolated
+                      uniform magnitude, their ratio and whether it was extrapolated
+
+    '''
+    iterations = [REMAPITERATIONS[-1]] if iterations is None else list(iterations)
+    assert(all(iteration in REMAPITERATIONS for iteration in iterations))
+    iiterations = [int(np.flatnonzero(REMAPITERATIONS == iteration)[0]) for iteration in iterations]
+    imetrics = [METRICSNAMES.index(metric) for metric in metrics]
+
+    catalog = get_metrics_catalog()
+    rrmkeys, rrmvalues = load_many_values(catalog.select(**dict(criteria, grid='RRM')), nprocs)
+
+    # Uniform metrics of each group: uniform[group, src, tgt, iteration, metric]
+    groups = {}
+    for key in rrmkeys:
+        groups.setdefault(get_rrm_group(key), len(groups))
+    uniformkeys = [key for key in catalog.select(grid=RRM_UNIFORM_GRID) if get_rrm_group(key) in groups]
+    uniformkeys, uniformvalues = load_many_values(uniformkeys, nprocs)
+    uniform = np.full((len(groups), NRESOLUTIONS, NRESOLUTIONS, len(iiterations), len(imetrics)), np.nan)
+    uniformgroups = np.array([groups[get_rrm_group(key)] for key in uniformkeys], dtype=np.int64)
+    uniform[uniformgroups, [key[3] for key in uniformkeys], [key[4] for key in uniformkeys]] = \
+        uniformvalues[:, iiterations][:, :, imetrics]
+
+    rrmsrc, rrmtgt = get_rrm_spacings()
+    hsrc = rrmsrc[[key[3] for key in rrmkeys]]
+    htgt = rrmtgt[[key[4] for key in rrmkeys]]
+    casegroups = np.array([groups[get_rrm_group(key)] for key in rrmkeys], dtype=np.int64)
+    interpolated, extrapolated = interpolate_uniform(uniform, casegroups, hsrc, htgt)
+    rrm = rrmvalues[:, iiterations][:, :, imetrics]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.abs(rrm) / interpolated
+
+    # Flatten into a tidy table
+    nvalues = len(iiterations) * len(imetrics)
+    table = {}
+    for dim in RRM_GROUP + ['src', 'tgt']:
+        idim = STORE_DIMENSIONS.index(dim)
+        table[dim] = np.repeat([key[idim] for key in rrmkeys], nvalues)
+    table['src_spacing'] = np.repeat(hsrc, nvalues)
+    table['tgt_spacing'] = np.repeat(htgt, nvalues)
+    table['iteration'] = np.tile(np.repeat(REMAPITERATIONS[iiterations], len(imetrics)), len(rrmkeys))
+    table['metric'] = np.tile(list(metrics), len(rrmkeys) * len(iiterations))
+    table['rrm'] = rrm.ravel()
+    table['uniform'] = interpolated.ravel()
+    table['ratio'] = ratio.ravel()
+    table['extrapolated'] = np.repeat(extrapolated, nvalues)
+    return pd.DataFrame(table)
+
+
+def summarize_rrm_penalty(comparison, by=RRM_METHOD):
+    '''
+    Aggregate the RRM to uniform ratios of compare_rrm_uniform over the cases of
+    each group (default: method variation), per iteration and metric. Only
+    finite, nonzero ratios are aggregated.
+
+    Returns:
+    pandas dataframe: The number of cases, the geometric mean, median, min and max
+                      ratio and the fraction of cases where RRM does better (ratio < 1)
+
+    '''
+    valid = comparison[np.isfinite(comparison['ratio']) & (comparison['ratio'] > 0.0)]
+    valid = valid.assign(log_ratio=np.log10(valid['ratio']), benefit=valid['ratio'] < 1.0)
+    summary = valid.groupby(list(by) + ['iteration', 'metric'], sort=True).agg(
+        cases=('ratio', 'size'), geometric_mean_ratio=('log_ratio', 'mean'), median_ratio=('ratio', 'median'),
+        min_ratio=('ratio', 'min'), max_ratio=('ratio', 'max'), benefit_fraction=('benefit', 'mean')).reset_index()
+    summary['geometric_mean_ratio'] = 10.0 ** summary['geometric_mean_ratio']
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the RRM cases with the uniform cases at the same resolution')
+    parser.add_argument('--output', default=get_store_directory(RRM_COMPARISON_DIRECTORY), help='Directory to write the comparison tables to')
+    parser.add_argument('--metrics', nargs='+', choices=METRICSNAMES, default=METRICSNAMES,
+                        help='Metrics to compare. Default: all')
+    parser.add_argument('--iterations', nargs='+', type=int, choices=REMAPITERATIONS.tolist(), metavar='ITERATION',
+                        help='Remap iterations to compare. Default: {0}'.format(REMAPITERATIONS[-1]))
+    args = parser.parse_args()
+
+    comparison = compare_rrm_uniform(args.metrics, args.iterations)
+    tables = {'rrm_comparison': comparison, 'rrm_penalty': summarize_rrm_penalty(comparison)}
+    os.makedirs(args.output, exist_ok=True)
+    for name in RRM_TABLES:
+        tables[name].to_csv(os.path.join(args.output, name + '.csv'), index=False)
+    print('Compared {0} RRM cases into {1}'.format(
+        len(comparison) // (len(args.metrics) * len(args.iterations or [0])), args.output))
+
+
+if __name__ == "__main__":
+    main()
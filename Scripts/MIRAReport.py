@@ -0,0 +1,309 @@
+'''
+Single-file interactive HTML report of the MIRA metrics.
+
+The report embeds one copy of plotly.js and the metrics of all selected cases
+once, as a zlib-compressed float32 array with a columnar index of the case
+dimensions. The figures are drawn in the browser from that shared data with
+WebGL (scattergl) traces for the variable, grid combo, resolution pair and
+metrics picked in the page, so the full method x metric x resolution matrix
+fits in one responsive file instead of hundreds of images. When many method
+variations are overlaid, the iteration series are decimated before plotting,
+keeping the extrema of each bucket of iterations so that blow-ups stay visible.
+
+    write_report('report.html', grid=['CS-MPAS', 'RRM'])
+
+Usage:
+python ROOComparison.py --report report.html
+'''
+import io
+import json
+import zlib
+import base64
+from html import escape
+
+import numpy as np
+
+from MIRADatasets import (METRICSNAMES, REMAPITERATIONS, STORE_DIMENSIONS,
+                          get_metrics_catalog, load_many_values)
+
+# Metrics shown as log10 of their magnitude, as in plot_dataset
+LOG_METRICS = ['GC', 'GL1', 'GL2', 'GLinf', 'H12T', 'H1T', 'H12S', 'H1S']
+
+REPORT_AXIS_TITLES = {'GC': 'Global Field Integral',
+                      'GL1': 'L1 Global Error',
+                      'GL2': 'L2 Global Error',
+                      'GLinf': 'Linf Global Error',
+                      'GMaxE': 'Linf of Global Field Maxima',
+                      'GMinE': 'Linf of Global Field Minima',
+                      'LMaxL1': 'L1 of Local Field Maxima',
+                      'LMaxL2': 'L2 of Local Field Maxima',
+                      'LMaxLm': 'Linf of Local Field Maxima',
+                      'LMinL1': 'L1 of Local Field Minima',
+                      'LMinL2': 'L2 of Local Field Minima',
+                      'LMinLm': 'Linf of Local Field Minima',
+                      'H12T': 'H0.5 Gradient Error on Target',
+                      'H1T': 'H1 Gradient Error on Target',
+                      'H12S': 'H0.5 Gradient Error on Source',
+                      'H1S': 'H1 Gradient Error on Source'}
+
+# Iteration series are decimated to about REPORT_DECIMATED_POINTS points when a
+# panel overlays more than REPORT_DECIMATE_TRACES method variations: each bucket
+# of iterations keeps its minimum and maximum, and its first missing value. Browsers
+# limit the number of WebGL contexts, so at most REPORT_MAX_PANELS are drawn.
+REPORT_DECIMATE_TRACES = 8
+REPORT_DECIMATED_POINTS = 26
+REPORT_MAX_PANELS = 6
+
+REPORT_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>@TITLE@</title>
+<style>
+body { font-family: "Courier New", monospace; color: #444; margin: 1em 2em; }
+#controls label, #metrics label, #methods label { margin-right: 1.2em; white-space: nowrap; }
+#metrics, #methods { margin: 0.6em 0; line-height: 1.8em; }
+.panel { width: 800px; height: 500px; display: inline-block; }
+</style>
+<script type="text/javascript">@PLOTLYJS@</script>
+</head>
+<body>
+<h2>@TITLE@</h2>
+<div id="controls">
+<label>Variable <select id="variable"></select></label>
+<label>Grids <select id="grid"></select></label>
+<label>Source <select id="src"></select></label>
+<label>Target <select id="tgt"></select></label>
+</div>
+<div id="metrics"></div>
+<div id="methods"></div>
+<div id="status">Loading metrics...</div>
+<div id="panels"></div>
+<script id="report-index" type="application/json">@INDEX@</script>
+<script id="report-data" type="application/octet-stream">@DATA@</script>
+<script type="text/javascript">
+(async function () {
+  const index = JSON.parse(document.getElementById('report-index').textContent);
+  const encoded = document.getElementById('report-data').textContent.trim();
+  const response = await fetch('data:application/octet-stream;base64,' + encoded);
+  const shuffled = new Uint8Array(await new Response(
+    response.body.pipeThrough(new DecompressionStream('deflate'))).arrayBuffer());
+  const nvalues = shuffled.length / 4, bytes = new Uint8Array(shuffled.length);
+  for (let k = 0; k < 4; k++) {
+    for (let i = 0; i < nvalues; i++) bytes[4 * i + k] = shuffled[k * nvalues + i];
+  }
+  const values = new Float32Array(bytes.buffer);
+
+  const dims = index.dimensions, codes = index.codes;
+  const niterations = index.iterations.length, nmetrics = index.metrics.length;
+  const ncases = codes.method.length;
+  const hidden = new Set();
+
+  function value(c, dim) { return dims[dim][codes[dim][c]]; }
+  function label(c) {
+    const method = value(c, 'method'), subtype = value(c, 'subtype'), order = value(c, 'order');
+    if (method === 'ESMF') return method + '(' + subtype + ')';
+    const p = method === 'TempestRemap' ? order - 1 : order;
+    return method + (subtype ? '-' + subtype : '') + '(p=' + p + ')';
+  }
+  function fill(select, options, keep) {
+    const previous = select.value;
+    select.innerHTML = '';
+    for (const option of options) select.add(new Option(option, option));
+    if (keep && options.map(String).includes(previous)) select.value = previous;
+  }
+  // Indices of the points kept when decimating a series into buckets of
+  // iterations: the first and last points, and the minimum, the maximum and the
+  // first missing value of each bucket, so that spikes and gaps survive
+  function decimate(ys, bucket) {
+    const kept = new Set([0, ys.length - 1]);
+    for (let start = 0; start < ys.length; start += bucket) {
+      let imin = -1, imax = -1, imissing = -1;
+      for (let i = start; i < Math.min(start + bucket, ys.length); i++) {
+        if (ys[i] === null) {
+          if (imissing < 0) imissing = i;
+          continue;
+        }
+        if (imin < 0 || ys[i] < ys[imin]) imin = i;
+        if (imax < 0 || ys[i] > ys[imax]) imax = i;
+      }
+      for (const i of [imin, imax, imissing]) if (i >= 0) kept.add(i);
+    }
+    return [...kept].sort((a, b) => a - b);
+  }
+  function selected(id) { return document.getElementById(id).value; }
+  function checkboxes(container, names, checked, onchange) {
+    container.innerHTML = '';
+    for (const name of names) {
+      const box = document.createElement('input');
+      box.type = 'checkbox'; box.checked = checked(name);
+      box.addEventListener('change', () => onchange(name, box.checked));
+      const text = document.createElement('label');
+      text.append(box, ' ' + name);
+      container.append(text);
+    }
+  }
+
+  const shownMetrics = new Set(index.default_metrics);
+  checkboxes(document.getElementById('metrics'), index.metrics, m => shownMetrics.has(m), (m, on) => {
+    if (on) shownMetrics.add(m); else shownMetrics.delete(m);
+    render();
+  });
+
+  function updateResolutions() {
+    const grid = selected('grid'), srcs = new Set(), tgts = new Set();
+    for (let c = 0; c < ncases; c++) {
+      if (value(c, 'grid') !== grid) continue;
+      srcs.add(value(c, 'src')); tgts.add(value(c, 'tgt'));
+    }
+    fill(document.getElementById('src'), [...srcs].sort((a, b) => a - b), true);
+    fill(document.getElementById('tgt'), [...tgts].sort((a, b) => a - b), true);
+  }
+
+  function render() {
+    const variable = selected('variable'), grid = selected('grid');
+    const src = Number(selected('src')), tgt = Number(selected('tgt'));
+    const cases = [];
+    for (let c = 0; c < ncases; c++) {
+      if (value(c, 'variable') === variable && value(c, 'grid') === grid &&
+          value(c, 'src') === src && value(c, 'tgt') === tgt) cases.push(c);
+    }
+    cases.sort((a, b) => label(a).localeCompare(label(b)));
+    checkboxes(document.getElementById('methods'), cases.map(label), l => !hidden.has(l), (l, on) => {
+      if (on) hidden.delete(l); else hidden.add(l);
+      render();
+    });
+    const visible = cases.filter(c => !hidden.has(label(c)));
+
+    // Each bucket keeps up to two points, its minimum and its maximum
+    const bucket = visible.length > index.decimate_traces ? Math.ceil(2 * niterations / index.decimated_points) : 1;
+    let npoints = 0;
+
+    const metrics = index.metrics.filter(m => shownMetrics.has(m)).slice(0, index.max_panels);
+    const panels = document.getElementById('panels');
+    while (panels.children.length > metrics.length) {
+      Plotly.purge(panels.lastChild);
+      panels.lastChild.remove();
+    }
+    metrics.forEach((metric, ipanel) => {
+      if (ipanel >= panels.children.length) {
+        const div = document.createElement('div');
+        div.className = 'panel';
+        panels.append(div);
+      }
+      const m = index.metrics.indexOf(metric), logscale = index.log_metrics.includes(metric);
+      const traces = visible.map(c => {
+        const ys = index.iterations.map((_, i) => {
+          const v = values[(c * nmetrics + m) * niterations + i];
+          const y = logscale ? Math.log10(Math.abs(v)) : v;
+          return Number.isFinite(y) ? y : null;
+        });
+        const points = bucket > 1 ? decimate(ys, bucket) : ys.map((_, i) => i);
+        npoints = Math.max(npoints, points.length);
+        return {type: 'scattergl', mode: bucket > 1 ? 'lines' : 'lines+markers', name: label(c),
+                x: points.map(i => index.iterations[i]), y: points.map(i => ys[i])};
+      });
+      const layout = {
+        margin: {l: 60, r: 20, t: 40, b: 50}, showlegend: true,
+        title: {text: metric + ': ' + variable + ' - ' + grid + ' (' + src + '-' + tgt + ')', font: {size: 14}},
+        xaxis: {title: {text: 'Remap Iterations'}},
+        yaxis: {title: {text: (logscale ? 'log10 ' : '') + index.axis_titles[metric]}},
+        legend: {title: {text: 'Remapping Schemes'}},
+        font: {family: 'Courier New, monospace', size: 12, color: '#7f7f7f'}};
+      Plotly.react(panels.children[ipanel], traces, layout, {responsive: true, displaylogo: false});
+    });
+    document.getElementById('status').textContent = visible.length + ' method variations' +
+      (bucket > 1 ? ', decimated to at most ' + npoints + ' iterations' : '') +
+      (shownMetrics.size > index.max_panels ? ', showing the first ' + index.max_panels + ' metrics' : '');
+  }
+
+  fill(document.getElementById('variable'), dims.variable, false);
+  fill(document.getElementById('grid'), dims.grid, false);
+  updateResolutions();
+  document.getElementById('grid').addEventListener('change', () => { updateResolutions(); render(); });
+  for (const id of ['variable', 'src', 'tgt']) document.getElementById(id).addEventListener('change', render);
+  render();
+})();
+</script>
+</body>
+</html>
+'''
+
+
+def encode_report_data(keys, values):
+    '''
+    Encode the case keys as a columnar index (the values of each dimension and
+    a code per case) and the metrics as base64 of the zlib-compressed,
+    byte-shuffled float32 array
+
+    Returns:
+    dict: The index of the cases
+    string: The encoded metrics, laid out as (cases, metrics, iterations)
+
+    '''
+    dimensions, codes = {}, {}
+    for idim, dim in enumerate(STORE_DIMENSIONS):
+        uniques, inverse = np.unique(np.array([key[idim] for key in keys]), return_inverse=True)
+        dimensions[dim] = uniques.tolist()
+        codes[dim] = inverse.tolist()
+    # Diverged runs reach magnitudes beyond the float32 range: saturate them
+    # (and infinities) at the largest float32 so they stay visible as blow-ups
+    limit = np.finfo(np.float32).max
+    values = np.clip(values, -limit, limit).astype('<f4')
+    # Store each iteration series contiguously and group the bytes of equal
+    # significance together, which roughly halves the compressed size
+    series = np.ascontiguousarray(values.transpose(0, 2, 1))
+    data = zlib.compress(series.view(np.uint8).reshape(-1, 4).T.tobytes(), 6)
+    return {'dimensions': dimensions, 'codes': codes}, base64.b64encode(data).decode('ascii')
+
+
+def write_report(filename, metrics=METRICSNAMES, default_metrics=['GL2'],
+                 title='MIRA Remapping Intercomparison', chunksize=1024, **criteria):
+    '''
+    Write the metrics of all cases matching the criteria to a self-contained
+    interactive HTML report
+
+    Parameters:
+    filename (string): The HTML file to write
+    metrics (list): Metrics to embed. Default: METRICSNAMES
+    default_metrics (list): Metrics shown when the report is opened
+    title (string): Title of the report
+    chunksize (int): Number of cases loaded at a time
+    criteria: Dimension values selecting the cases, e.g. grid=['CS-MPAS'], order=[4]
+
+    Returns:
+    int: The number of cases in the report
+
+    '''
+    import plotly.offline
+
+    assert(all(metric in METRICSNAMES for metric in metrics))
+    columns = [METRICSNAMES.index(metric) for metric in metrics]
+    allkeys = get_metrics_catalog().select(**criteria)
+    keys, chunks = [], []
+    for start in range(0, len(allkeys), chunksize):
+        found, values = load_many_values(allkeys[start:start + chunksize])
+        keys.extend(found)
+        chunks.append(values[:, :, columns])
+    values = np.concatenate(chunks) if chunks else np.empty((0, len(REMAPITERATIONS), len(columns)))
+
+    index, data = encode_report_data(keys, values)
+    index.update({'metrics': list(metrics),
+                  'iterations': REMAPITERATIONS.tolist(),
+                  'default_metrics': [metric for metric in default_metrics if metric in metrics] or list(metrics[:1]),
+                  'log_metrics': LOG_METRICS,
+                  'axis_titles': REPORT_AXIS_TITLES,
+                  'decimate_traces': REPORT_DECIMATE_TRACES,
+                  'decimated_points': REPORT_DECIMATED_POINTS,
+                  'max_panels': REPORT_MAX_PANELS})
+
+    html = (REPORT_TEMPLATE.replace('@TITLE@', escape(title))
+            .replace('@INDEX@', json.dumps(index).replace('</', '<\\/'))
+            .replace('@DATA@', data))
+    before, after = html.split('@PLOTLYJS@')
+    with io.open(filename, 'w', encoding='utf-8') as freport:
+        freport.write(before)
+        freport.write(plotly.offline.get_plotlyjs())
+        freport.write(after)
+    print('Wrote {0} cases to {1}'.format(len(keys), filename))
+    return len(keys)
@@ -0,0 +1,338 @@
+'''
+Local HTTP query service over the MIRA metrics archive.
+
+The whole archive is loaded into memory once (from the consolidated store when
+it has been built, else from the metrics files) and served by an asyncio HTTP
+server, so dashboards can issue many small queries without starting Python or
+re-reading CSV files. The service only uses the standard library, numpy and
+pandas; pyarrow is needed only for Arrow responses.
+
+Endpoints (GET, dimension filters take comma-separated values):
+    /dimensions                   Available values of each dimension
+    /slice?method=GMLS&subtype=CAAS&grid=CS-MPAS&src=0&tgt=4&variable=Topography&metric=GL2,GC
+                                  Metric values per case and iteration; iteration=1,1000 or final
+    /aggregate?grid=CS-MPAS&metric=GL2&by=method,order&agg=mean&iteration=final
+                                  Metrics aggregated over the cases of each group
+    /stats                        Request counts and latency percentiles per endpoint
+Responses are JSON (pandas "split" layout), or Arrow IPC streams with format=arrow.
+
+Usage:
+python MIRAService.py [--host 127.0.0.1] [--port 8765]
+'''
+import json
+import time
+import asyncio
+import functools
+import argparse
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from MIRADatasets import (METRICSNAMES, REMAPITERATIONS, STORE_DIMENSIONS,
+                          get_metrics_catalog, get_metrics_store, load_many_values)
+from MIRAProfiling import latency_summary
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+
+# Number of recent request latencies kept per endpoint for the statistics
+LATENCY_WINDOW = 10000
+
+AGGREGATIONS = ['mean', 'median', 'min', 'max', 'std', 'count']
+INTEGER_DIMENSIONS = ['src', 'tgt', 'order']
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error'}
+
+
+class ResidentArchive:
+    '''
+    All cases of the metrics archive held in memory: the case keys, a table of
+    their dimensions for filtering and the metrics array of shape
+    (cases, iterations, metrics)
+    '''
+
+    def __init__(self, keys, values):
+        self.keys = keys
+        self.values = values
+        self.cases = pd.DataFrame(keys, columns=STORE_DIMENSIONS)
+
+    @classmethod
+    def load(cls, nprocs=None):
+        store = get_metrics_store()
+        if store is not None:
+            return cls(list(store.keys), np.array(store.values))
+        keys, values = load_many_values(get_metrics_catalog().select(), nprocs)
+        return cls(keys, values)
+
+    def select(self, criteria):
+        '''
+        Return the rows of the cases matching all dimension criteria (lists of accepted values)
+        '''
+        mask = np.ones(len(self.keys), dtype=bool)
+        for dim, values in criteria.items():
+            mask &= self.cases[dim].isin(values).to_numpy()
+        return np.flatnonzero(mask)
+
+
+def parse_query(query):
+    '''
+    Return the parameters of a query string. Blank values are kept, so that
+    subtype= selects the plain method variations.
+    '''
+    return parse_qs(query, keep_blank_values=True)
+
+
+def _parse_list(params, name, default=None):
+    values = [value for values in params.get(name, []) for value in values.split(',') if value != '']
+    return values or default
+
+
+def parse_criteria(params):
+    '''
+    Return the dimension criteria of a query, e.g. {'method': ['GMLS'], 'order': [3, 4]}
+    '''
+    criteria = {}
+    for dim in STORE_DIMENSIONS:
+        values = _parse_list(params, dim)
+        if values is None:
+            continue
+        if dim in INTEGER_DIMENSIONS:
+            try:
+                values = [int(value) for value in values]
+            except ValueError:
+                raise ValueError('{0} takes integer values'.format(dim))
+        criteria[dim] = values
+    # An empty subtype selects the plain method variations
+    if 'subtype' in params and not criteria.get('subtype'):
+        criteria['subtype'] = ['']
+    return criteria
+
+
+def parse_metrics(params):
+    metrics = _parse_list(params, 'metric', METRICSNAMES)
+    unknown = [metric for metric in metrics if metric not in METRICSNAMES]
+    if unknown:
+        raise ValueError('Unknown metrics: ' + ', '.join(unknown))
+    return [METRICSNAMES.index(metric) for metric in metrics]
+
+
+def parse_iterations(params, default):
+    '''
+    Return the positions in REMAPITERATIONS of the requested iterations ("final" is the last one)
+    '''
+    iterations = _parse_list(params, 'iteration', default)
+    if iterations is None:
+        return np.arange(len(REMAPITERATIONS))
+    positions = []
+    for iteration in iterations:
+        if iteration == 'final':
+            positions.append(len(REMAPITERATIONS) - 1)
+            continue
+        matches = np.flatnonzero(REMAPITERATIONS == int(iteration)) if iteration.isdigit() else []
+        if len(matches) == 0:
+            raise ValueError('Unknown remap iteration: ' + iteration)
+        positions.append(matches[0])
+    return np.array(positions)
+
+
+def query_dimensions(archive, params):
+    return {dim: sorted(archive.cases[dim].unique().tolist()) for dim in STORE_DIMENSIONS}
+
+
+def query_slice(archive, params):
+    '''
+    Return the requested metrics of the matching cases at the requested
+    iterations, one row per case and iteration
+    '''
+    rows = archive.select(parse_criteria(params))
+    metrics = parse_metrics(params)
+    iterations = parse_iterations(params, None)
+
+    values = archive.values[np.ix_(rows, iterations, metrics)]
+    table = archive.cases.iloc[np.repeat(rows, len(iterations))].reset_index(drop=True)
+    table['iteration'] = np.tile(REMAPITERATIONS[iterations], len(rows))
+    for imetric, metric in enumerate(metrics):
+        table[METRICSNAMES[metric]] = values[:, :, imetric].ravel()
+    return table
+
+
+def query_aggregate(archive, params):
+    '''
+    Return the requested metrics of the matching cases aggregated over the
+    groups of the "by" dimensions, at each requested iteration (default: final)
+    '''
+    by = _parse_list(params, 'by', [])
+    unknown = [dim for dim in by if dim not in STORE_DIMENSIONS]
+    if unknown:
+        raise ValueError('Unknown dimensions: ' + ', '.join(unknown))
+    agg = params.get('agg', ['mean'])[0]
+    if agg not in AGGREGATIONS:
+        raise ValueError('agg must be one of ' + ', '.join(AGGREGATIONS))
+
+    params = dict(params, iteration=params.get('iteration', ['final']))
+    table = query_slice(archive, params)
+    groups = by + ['iteration']
+    metrics = [column for column in table.columns if column in METRICSNAMES]
+    return table.groupby(groups, sort=True)[metrics].agg(agg).reset_index()
+
+
+def encode_table(table, params):
+    '''
+    Encode a dataframe as JSON or, with format=arrow, as an Arrow IPC stream
+    '''
+    if params.get('format', ['json'])[0] == 'arrow':
+        try:
+            import pyarrow
+        except ImportError:
+            raise ValueError('Arrow responses need pyarrow')
+        sink = pyarrow.BufferOutputStream()
+        arrowtable = pyarrow.Table.from_pandas(table, preserve_index=False)
+        with pyarrow.ipc.new_stream(sink, arrowtable.schema) as writer:
+            writer.write_table(arrowtable)
+        return 'application/vnd.apache.arrow.stream', sink.getvalue().to_pybytes()
+    # Same layout as DataFrame.to_json(orient='split', index=False), built from the
+    # column arrays which is much faster than the row-wise pandas encoder. NaN and
+    # infinities are not valid JSON and are sent as null.
+    columns = []
+    for column in table.columns:
+        values = table[column].to_numpy()
+        if values.dtype.kind == 'f' and not np.isfinite(values).all():
+            values = np.where(np.isfinite(values), values, None)
+        columns.append(values.tolist())
+    body = {'columns': list(table.columns), 'data': list(zip(*columns))}
+    return 'application/json', json.dumps(body, allow_nan=False).encode()
+
+
+class MetricsService:
+    '''
+    The asyncio HTTP server answering the queries over a ResidentArchive
+    '''
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.started = time.time()
+        self.latencies = {}
+        self.errors = 0
+        self.routes = {'/dimensions': query_dimensions,
+                       '/slice': query_slice,
+                       '/aggregate': query_aggregate,
+                       '/stats': self.query_stats}
+
+    def query_stats(self, archive, params, latencies=None):
+        '''
+        Return the service statistics. The latency windows are appended to on
+        the event loop thread, so handle() passes a copy made there.
+        '''
+        if latencies is None:
+            latencies = {path: list(values) for path, values in self.latencies.items()}
+        return {'uptime_seconds': time.time() - self.started,
+                'cases': len(archive.keys),
+                'resident_megabytes': archive.values.nbytes / 1024**2,
+                'errors': self.errors,
+                'endpoints': {path: dict(requests=len(values), **latency_summary(values))
+                              for path, values in latencies.items()}}
+
+    def answer(self, path, params, route=None):
+        '''
+        Run a query, by default the route of the path, and return (status, content type, body)
+        '''
+        route = route or self.routes.get(path)
+        if route is None:
+            return 404, 'application/json', json.dumps({'error': 'Unknown endpoint ' + path}).encode()
+        try:
+            result = route(self.archive, params)
+            if isinstance(result, pd.DataFrame):
+                contenttype, body = encode_table(result, params)
+            else:
+                contenttype, body = 'application/json', json.dumps(result, allow_nan=False).encode()
+            return 200, contenttype, body
+        except ValueError as error:
+            return 400, 'application/json', json.dumps({'error': str(error)}).encode()
+
+    async def handle(self, reader, writer):
+        '''
+        Serve the requests of one connection, keeping it alive between requests
+        '''
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                requestline = await reader.readline()
+                if not requestline:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                start = time.perf_counter()
+                fields = requestline.decode('latin-1').split()
+                if len(fields) == 3:
+                    method, target, version = fields
+                else:
+                    method, target, version = None, '', 'HTTP/1.1'
+                url = urlsplit(target)
+                if method is None:
+                    status, contenttype, body = 400, 'application/json', b'{"error": "Malformed request line"}'
+                elif method != 'GET':
+                    status, contenttype, body = 405, 'application/json', b'{"error": "Only GET is supported"}'
+                else:
+                    route = None
+                    if url.path == '/stats':
+                        snapshot = {path: list(values) for path, values in self.latencies.items()}
+                        route = functools.partial(self.query_stats, latencies=snapshot)
+                    try:
+                        status, contenttype, body = await loop.run_in_executor(
+                            None, self.answer, url.path, parse_query(url.query), route)
+                    except Exception as error:
+                        status, contenttype, body = 500, 'application/json', json.dumps({'error': str(error)}).encode()
+
+                keepalive = (method is not None and headers.get('connection', '').lower() != 'close' and
+                             (version == 'HTTP/1.1' or headers.get('connection', '').lower() == 'keep-alive'))
+                writer.write('{0} {1} {2}\r\nContent-Type: {3}\r\nContent-Length: {4}\r\nConnection: {5}\r\n\r\n'.format(
+                    version, status, HTTP_REASONS[status], contenttype, len(body),
+                    'keep-alive' if keepalive else 'close').encode('latin-1') + body)
+                await writer.drain()
+
+                if status == 200:
+                    self.latencies.setdefault(url.path, deque(maxlen=LATENCY_WINDOW)).append(
+                        time.perf_counter() - start)
+                else:
+                    self.errors += 1
+                if not keepalive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        print('Serving {0} cases on http://{1}:{2}/'.format(len(self.archive.keys), host, port))
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve queries over the MIRA metrics archive')
+    parser.add_argument('--host', default=SERVICE_HOST, help='Address to listen on')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='Port to listen on')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    archive = ResidentArchive.load()
+    print('Loaded {0} cases ({1:.1f} MB) in {2:.1f} s'.format(
+        len(archive.keys), archive.values.nbytes / 1024**2, time.perf_counter() - start))
+    try:
+        asyncio.run(MetricsService(archive).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+'''
+Spherical-harmonic power spectra of the sampled reference fields.
+
+The fields of each mesh are binned onto a Gauss-Legendre quadrature (GLQ) grid
+with an area-weighted operator that is built once per mesh and applied to all
+variables together, and expanded with pyshtools using quadrature tables that
+are computed once per degree. The spectra are cached on disk under
+MetricsStore/spectra/, keyed by the mesh file (size and modification time), the
+variable and the maximum degree, so report runs only compute the missing ones.
+
+    spectra = compute_all_spectra()
+    spectra[(spectra.grid == 'CS') & (spectra.variable == 'Topography')]
+
+pyshtools and scipy are imported on first use.
+'''
+import os
+import functools
+
+import numpy as np
+import pandas as pd
+
+from MIRADatasets import DATAVARIABLES, NRESOLUTIONS, NRRMRESOLUTIONS, get_store_directory
+from MIRAMeshes import MESHFILES, RRM_MESHFILES, get_mesh_filename, MeshFile
+from MIRAProfiling import stage
+
+# Directory of the cached spectra under MetricsStorePath
+SPECTRA_CACHE_DIRECTORY = 'spectra'
+
+# Bump when the binning or the expansion changes to invalidate the cached spectra
+SPECTRA_CACHE_VERSION = 1
+
+# Largest degree of the expansions, and the mean number of mesh elements per GLQ
+# grid point used to pick the degree of each mesh
+SPECTRA_LMAX = 512
+ELEMENTS_PER_NODE = 4
+
+SPECTRA_MESHES = ([(GridType, iRES, False) for GridType in MESHFILES for iRES in range(NRESOLUTIONS)] +
+                  [(GridType, iRES, True) for GridType in RRM_MESHFILES for iRES in range(NRRMRESOLUTIONS)])
+
+
+def get_spectrum_lmax(nelements):
+    '''
+    Return the maximum degree resolved by a mesh with nelements elements: the
+    GLQ grid of (lmax+1) x (2 lmax+1) points has ELEMENTS_PER_NODE elements per point
+    '''
+    return int(min(SPECTRA_LMAX, np.sqrt(nelements / (2.0 * ELEMENTS_PER_NODE)) - 1))
+
+
+@functools.lru_cache(maxsize=None)
+def get_glq_tables(lmax):
+    '''
+    Return the GLQ nodes and weights and the grid latitudes and longitudes in
+    degrees for expansions up to degree lmax, computed once per degree
+    '''
+    import pyshtools
+    with stage('glq_tables'):
+        zero, weights = pyshtools.expand.SHGLQ(lmax)
+        latitudes, longitudes = pyshtools.expand.GLQGridCoord(lmax)
+    return zero, weights, latitudes, longitudes
+
+
+def get_binning_operator(mesh, lmax):
+    '''
+    Return the sparse operator averaging the elements of a mesh onto the GLQ grid
+    of degree lmax. Grid points without any element center take the value of the
+    nearest element.
+
+    Parameters:
+    mesh (MeshFile): The opened mesh
+    lmax (int): Maximum degree of the GLQ grid
+
+    Returns:
+    scipy sparse matrix: Operator of shape (nlat * nlon, nelements)
+
+    '''
+    from scipy.sparse import coo_matrix
+    from scipy.spatial import cKDTree
+
+    zero, weights, latitudes, longitudes = get_glq_tables(lmax)
+    nlat, nlon = len(latitudes), len(longitudes)
+    with stage('binning_operator'):
+        centers = mesh.cell_centers()
+        areas = mesh.cell_areas()
+        celllat = np.degrees(np.arcsin(np.clip(centers[:, 2], -1.0, 1.0)))
+        celllon = np.degrees(np.arctan2(centers[:, 1], centers[:, 0])) % 360.0
+
+        # GLQ latitudes decrease from north to south
+        ascending = latitudes[::-1]
+        ilat = nlat - 1 - np.searchsorted(0.5 * (ascending[1:] + ascending[:-1]), celllat)
+        ilon = np.floor(celllon / (360.0 / nlon) + 0.5).astype(np.int64) % nlon
+        bins = ilat * nlon + ilon
+
+        # Fill the grid points without elements with their nearest element
+        empty = np.flatnonzero(np.bincount(bins, minlength=nlat * nlon) == 0)
+        nodelat = np.radians(latitudes[empty // nlon])
+        nodelon = np.radians(longitudes[empty % nlon])
+        nodes = np.stack([np.cos(nodelat) * np.cos(nodelon), np.cos(nodelat) * np.sin(nodelon),
+                          np.sin(nodelat)], axis=1)
+        nearest = cKDTree(centers).query(nodes)[1] if len(empty) else np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate([bins, empty])
+        columns = np.concatenate([np.arange(len(bins)), nearest])
+        values = np.concatenate([areas, np.ones(len(empty))])
+        operator = coo_matrix((values, (rows, columns)), shape=(nlat * nlon, len(bins))).tocsr()
+        rowsums = np.asarray(operator.sum(axis=1)).ravel()
+        operator = operator.multiply(1.0 / rowsums[:, None]).tocsr()
+    return operator
+
+
+def compute_power_spectra(grids, lmax):
+    '''
+    Expand GLQ grids of shape (nvariables, lmax+1, 2 lmax+1) in 4pi-normalized
+    spherical harmonics and return their power per degree, shape (nvariables, lmax+1)
+    '''
+    import pyshtools
+    zero, weights, latitudes, longitudes = get_glq_tables(lmax)
+    spectra = np.empty((len(grids), lmax + 1))
+    for igrid, grid in enumerate(grids):
+        with stage('sh_expand'):
+            cilm = pyshtools.expand.SHExpandGLQ(grid, weights, zero)
+        spectra[igrid] = (cilm ** 2).sum(axis=(0, 2))
+    return spectra
+
+
+def get_spectrum_cache_file(filename, variable, lmax):
+    '''
+    Return the cache file of the spectrum of a variable of a mesh file. The key
+    includes the size and modification time of the mesh file so that the cached
+    spectra of a changed mesh are not reused.
+    '''
+    status = os.stat(filename)
+    name = '{0}_{1}_{2}_{3}_L{4}_v{5}.npz'.format(
+        os.path.splitext(os.path.basename(filename))[0], status.st_size, status.st_mtime_ns,
+        variable, lmax, SPECTRA_CACHE_VERSION)
+    return os.path.join(get_store_directory(SPECTRA_CACHE_DIRECTORY), name)
+
+
+def compute_spectra(GridType, iRES, isRRM=False, variables=None, lmax=None, cache=True):
+    '''
+    Compute the power spectra of the reference fields of one mesh. The mesh and
+    its fields are only read when some of the spectra are not cached yet.
+
+    Parameters:
+    GridType (string): Grid of the mesh, see get_mesh_filename
+    iRES (int): Index of the resolution
+    isRRM (bool): Regionally refined mesh
+    variables (list): Names of the fields. Default: DATAVARIABLES
+    lmax (int): Maximum degree. Default: resolved by the mesh, see get_spectrum_lmax
+    cache (bool): Read and write the on-disk spectra cache
+
+    Returns:
+    pandas dataframe: The power of each variable (columns) per degree (index)
+
+    '''
+    filename = get_mesh_filename(GridType, iRES, isRRM)
+    variables = list(DATAVARIABLES if variables is None else variables)
+
+    mesh = None
+    try:
+        if lmax is None:
+            mesh = MeshFile(filename)
+            lmax = get_spectrum_lmax(mesh.nelements)
+
+        spectra = {}
+        if cache:
+            for variable in variables:
+                cachefile = get_spectrum_cache_file(filename, variable, lmax)
+                if os.path.exists(cachefile):
+                    with np.load(cachefile) as cached:
+                        spectra[variable] = cached['power']
+
+        missing = [variable for variable in variables if variable not in spectra]
+        if missing:
+            if mesh is None:
+                mesh = MeshFile(filename)
+            operator = get_binning_operator(mesh, lmax)
+            fields = np.stack([mesh.read_field(variable) for variable in missing], axis=1)
+            with stage('binning'):
+                grids = (operator @ fields).T.reshape(len(missing), lmax + 1, 2 * lmax + 1)
+            for variable, power in zip(missing, compute_power_spectra(grids, lmax)):
+                spectra[variable] = power
+                if cache:
+                    cachefile = get_spectrum_cache_file(filename, variable, lmax)
+                    os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+                    np.savez(cachefile + '.tmp.npz', power=power)
+                    os.replace(cachefile + '.tmp.npz', cachefile)
+    finally:
+        if mesh is not None:
+            mesh.close()
+
+    return pd.DataFrame({variable: spectra[variable] for variable in variables},
+                        index=pd.RangeIndex(lmax + 1, name='degree'))
+
+
+def compute_all_spectra(meshes=SPECTRA_MESHES, variables=None, lmax=None, cache=True):
+    '''
+    Compute the power spectra of the reference fields on all meshes, each mesh
+    being read once for all variables
+
+    Parameters:
+    meshes (list): (GridType, iRES, isRRM) of the meshes. Default: all uniform and RRM meshes
+    variables (list): Names of the fields. Default: DATAVARIABLES
+    lmax (int): Maximum degree. Default: resolved by each mesh
+    cache (bool): Read and write the on-disk spectra cache
+
+    Returns:
+    pandas dataframe: Columns grid, resolution, rrm, variable, degree and power
+
+    '''
+    tables = []
+    for GridType, iRES, isRRM in meshes:
+        spectra = compute_spectra(GridType, iRES, isRRM, variables, lmax, cache)
+        table = spectra.reset_index().melt(id_vars='degree', var_name='variable', value_name='power')
+        table.insert(0, 'grid', GridType)
+        table.insert(1, 'resolution', iRES)
+        table.insert(2, 'rrm', isRRM)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
@@ -0,0 +1,218 @@
+'''
+Summary tables and method rankings over the whole MIRA metrics archive.
+
+Every case is loaded once, in chunks, and reduced to a few numbers per metric:
+the value at the final remap iteration, the growth rate over REMAPITERATIONS
+(slope of log10|metric| against log10(iteration)) and the global bounds
+violations measured by GMaxE/GMinE. The methods are then ranked within each
+group of grid combo, resolution pair and variable. Only the compact per-case
+summaries are kept in memory, so the full uniform and RRM archive is
+processed with bounded memory.
+
+Usage:
+python MIRASummary.py [--output ../MetricsStore/summary/] [--grids CS-MPAS RRM]
+'''
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from MIRADatasets import (GRIDTYPES, METRICSNAMES, REMAPITERATIONS, STORE_DIMENSIONS, get_store_directory,
+                          get_metrics_catalog, load_many_values)
+from MIRAConvergence import fit_power_law
+
+# Directory of the summary tables under MetricsStorePath
+SUMMARY_DIRECTORY = 'summary'
+
+# Columns identifying a group of competing cases and a method variation within a group
+SUMMARY_GROUP = ['grid', 'src', 'tgt', 'variable']
+SUMMARY_METHOD = ['method', 'subtype', 'order']
+
+# GMaxE and GMinE are positive when the global maximum or minimum of the source
+# field is lost to diffusion, as in monotone schemes, and negative when a new
+# global maximum (overshoot) or minimum (undershoot) appears; only new extrema
+# beyond this tolerance count as bounds violations
+BOUNDS_TOLERANCE = 1e-12
+
+SUMMARY_TABLES = ['metric_summary', 'bounds_summary', 'method_ranking']
+
+
+def summarize_values(keys, values):
+    '''
+    Reduce the metrics of a chunk of cases to their per-case summaries
+
+    Parameters:
+    keys (list): Case keys as laid out in STORE_DIMENSIONS
+    values (numpy array): Metrics of the cases with shape (len(keys), iterations, metrics)
+
+    Returns:
+    pandas dataframe: One row per case and metric with the final value and growth rate
+    pandas dataframe: One row per case with the bounds violations over all iterations
+
+    '''
+    ncases, niterations, nmetrics = values.shape
+    casecolumns = {dim: [key[idim] for key in keys] for idim, dim in enumerate(STORE_DIMENSIONS)}
+
+    growth = fit_power_law(REMAPITERATIONS, np.moveaxis(values, 1, 2))[0]
+    metrics = {dim: np.repeat(column, nmetrics) for dim, column in casecolumns.items()}
+    metrics['metric'] = np.tile(METRICSNAMES, ncases)
+    metrics['final'] = values[:, -1, :].ravel()
+    metrics['growth'] = growth.ravel()
+
+    overshoot = -values[:, :, METRICSNAMES.index('GMaxE')]
+    undershoot = values[:, :, METRICSNAMES.index('GMinE')]
+    violated = (overshoot > BOUNDS_TOLERANCE) | (undershoot < -BOUNDS_TOLERANCE)
+    firstviolation = np.where(violated.any(axis=1),
+                              REMAPITERATIONS[np.argmax(violated, axis=1)], -1)
+    bounds = dict(casecolumns)
+    bounds['violations'] = violated.sum(axis=1)
+    bounds['first_violation'] = firstviolation
+    bounds['max_overshoot'] = np.maximum(overshoot.max(axis=1), 0.0)
+    bounds['max_undershoot'] = np.minimum(undershoot.min(axis=1), 0.0)
+
+    return pd.DataFrame(metrics), pd.DataFrame(bounds)
+
+
+def rank_methods(metricsummary):
+    '''
+    Rank the method variations within each group and metric by the magnitude of
+    the final-iteration value (rank 1 is the smallest error)
+
+    Returns:
+    pandas dataframe: The metric summary with an added rank column
+
+    '''
+    metricsummary = metricsummary.copy()
+    magnitude = metricsummary['final'].abs()
+    metricsummary['rank'] = magnitude.groupby(
+        [metricsummary[column] for column in SUMMARY_GROUP + ['metric']]).rank(method='min')
+    return metricsummary
+
+
+def aggregate_ranking(metricsummary):
+    '''
+    Aggregate the ranks of each method variation per grid combo and metric
+
+    Returns:
+    pandas dataframe: Mean rank, number of first ranks and number of groups per
+                      grid, method variation and metric
+
+    '''
+    grouped = metricsummary.groupby(['grid'] + SUMMARY_METHOD + ['metric'], sort=True)['rank']
+    return pd.DataFrame({'mean_rank': grouped.mean(),
+                         'wins': grouped.apply(lambda ranks: int((ranks == 1).sum())),
+                         'groups': grouped.size()}).reset_index()
+
+
+def summarize_archive(keys=None, chunksize=256, nprocs=None, **criteria):
+    '''
+    Stream the cases of the archive once and build the summary tables
+
+    Parameters:
+    keys (list): Case keys to summarize. Default: all cases in the catalog matching criteria
+    chunksize (int): Number of cases loaded at a time, which bounds the memory used
+    nprocs (int): Number of worker processes for loading the datasets, see load_many
+    criteria: Dimension values selecting the cases, e.g. grid=['CS-MPAS', 'RRM']
+
+    Returns:
+    dict: The metric_summary, bounds_summary and method_ranking tables
+
+    '''
+    if keys is None:
+        keys = get_metrics_catalog().select(**criteria)
+    # Keep the cases of a group together so that partial summaries can be merged by group
+    keys = sorted(keys, key=lambda key: tuple(key[STORE_DIMENSIONS.index(dim)] for dim in SUMMARY_GROUP))
+
+    metricsummaries, boundssummaries = [], []
+    for start in range(0, len(keys), chunksize):
+        found, values = load_many_values(keys[start:start + chunksize], nprocs)
+        if found:
+            metricsummary, boundssummary = summarize_values(found, values)
+            metricsummaries.append(metricsummary)
+            boundssummaries.append(boundssummary)
+
+    if not metricsummaries:
+        metricsummary, boundssummary = summarize_values([], np.empty((0, len(REMAPITERATIONS), len(METRICSNAMES))))
+        metricsummaries.append(metricsummary)
+        boundssummaries.append(boundssummary)
+    metricsummary = rank_methods(pd.concat(metricsummaries, ignore_index=True))
+    return {'metric_summary': metricsummary,
+            'bounds_summary': pd.concat(boundssummaries, ignore_index=True),
+            'method_ranking': aggregate_ranking(metricsummary)}
+
+
+def update_summary_tables(tables, keys, nprocs=None):
+    '''
+    Recompute the summaries of the groups (grid combo, resolution pair and
+    variable) containing the given case keys, e.g. after new datasets were
+    ingested, and merge them into existing summary tables. The other groups
+    are not reloaded.
+
+    Parameters:
+    tables (dict): Summary tables from summarize_archive or read_summary_tables
+    keys (list): Case keys of the new or changed datasets
+
+    Returns:
+    dict: The updated summary tables
+
+    '''
+    groups = set(tuple(key[STORE_DIMENSIONS.index(dim)] for dim in SUMMARY_GROUP) for key in keys)
+    groupkeys = [key for key in get_metrics_catalog().select()
+                 if tuple(key[STORE_DIMENSIONS.index(dim)] for dim in SUMMARY_GROUP) in groups]
+    updated = summarize_archive(keys=groupkeys, nprocs=nprocs)
+
+    merged = {}
+    for name in ['metric_summary', 'bounds_summary']:
+        table = tables[name]
+        affected = pd.MultiIndex.from_frame(table[SUMMARY_GROUP]).isin(list(groups))
+        merged[name] = pd.concat([table[~affected], updated[name]], ignore_index=True).sort_values(
+            SUMMARY_GROUP + SUMMARY_METHOD, kind='stable', ignore_index=True)
+    merged['method_ranking'] = aggregate_ranking(merged['metric_summary'])
+    return merged
+
+
+def get_summary_path():
+    '''
+    Return the default directory of the summary tables, under the current MetricsStorePath
+    '''
+    return get_store_directory(SUMMARY_DIRECTORY)
+
+
+def write_summary_tables(tables, summarypath=None):
+    '''
+    Write the summary tables as CSV files into summarypath (default: get_summary_path())
+    '''
+    if summarypath is None:
+        summarypath = get_summary_path()
+    os.makedirs(summarypath, exist_ok=True)
+    for name in SUMMARY_TABLES:
+        tables[name].to_csv(os.path.join(summarypath, name + '.csv'), index=False)
+
+
+def read_summary_tables(summarypath=None):
+    '''
+    Read the summary tables written by write_summary_tables
+    '''
+    if summarypath is None:
+        summarypath = get_summary_path()
+    return {name: pd.read_csv(os.path.join(summarypath, name + '.csv'), dtype={'subtype': str}).fillna({'subtype': ''})
+            for name in SUMMARY_TABLES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize and rank the remapping methods over the metrics archive')
+    parser.add_argument('--output', default=get_summary_path(), help='Directory to write the summary tables to')
+    parser.add_argument('--grids', nargs='+', choices=GRIDTYPES + ['RRM'],
+                        help='Grid combos to include. Default: all')
+    parser.add_argument('--chunksize', type=int, default=256, help='Number of cases loaded at a time')
+    args = parser.parse_args()
+
+    criteria = {'grid': args.grids} if args.grids else {}
+    tables = summarize_archive(chunksize=args.chunksize, **criteria)
+    write_summary_tables(tables, args.output)
+    print('Summarized {0} cases into {1}'.format(len(tables['bounds_summary']), args.output))
+
+
+if __name__ == "__main__":
+    main()
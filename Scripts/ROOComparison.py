@@ -1,246 +1,40 @@
-import plotly.express as px
-import time
-import plotly
 import os
+import json
+import hashlib
+import importlib
 import pandas as pd
 import numpy as np
-from scipy.stats import linregress
-
-from plotly import tools
-import chart_studio.plotly as py
-import plotly.graph_objs as go
-
-# Global variables
-NMETHODS = 4
-NDATASETS = 3
-NRESOLUTIONS = 5
-MetricsFilePath = '../MetricsData/'
-
-# Our reference data resolutions for different grids
-METHODS = ['TempestRemap', 'GMLS', 'WLS-ENOR', 'ESMF']
-GRIDTYPES = ['CS-MPAS', 'MPAS-RLL', 'RLL-CS']
-DATAVARIABLES = ['AnalyticalFun1', 'AnalyticalFun2',
-                 'CloudFraction', 'Topography', 'TotalPrecipWater']
-CSRES = ['16', '32', '64', '128', '256']
-CSELEMS = [1536, 6144, 24576, 98304, 393216]
-ICODRES = ['16', '32', '64', '128', '256']
-ICODELEMS = [2562, 10242, 40962, 163842, 655362]
-RLLRES = ['30-60', '90-180', '180-360', '360-720', '720-1440']
-RLLELEMS = [1800, 16200, 64800, 259200, 1036800]
-
-NRRMRESOLUTIONS = 3
-RRMCSELEMS = [15858, 112606, 247328]
-RRMICODELEMS = [15970, 28535, 67886]
-
-# Supported orders for each method
-TR_SUPPORTED_ORDERS = [1, 2, 3, 4]
-TR_SUBTYPES = ['', 'CAAS']
-GMLS_SUPPORTED_ORDERS = [2, 3, 4, 5]
-GMLS_SUBTYPES = ['', 'CAAS', 'Normalized']
-WLSENOR_SUPPORTED_ORDERS = [2, 3, 4]
-ESMF_SUPPORTED_ORDERS = [1, 2]
-ESMF_SUBTYPES = ['conserve1st', 'conserve2nd', 'bilinear']
-
-# Store the metrics names available
-METRICSNAMES = ['GC', 'GL1', 'GL2', 'GLinf', 'GMaxE', 'GMinE', 'LMaxL1', 'LMaxL2',
-                'LMaxLm', 'LMinL1', 'LMinL2', 'LMinLm', 'H12T', 'H1T', 'H12S', 'H1S']
-
-# Store the reference remap iteration points used in the study for plotting
-riter = np.linspace(10, 1000, 100, dtype='int32')
-REMAPITERATIONS = np.insert(riter, 0, 1, axis=0)
 
-pd.options.display.float_format = '{:,.15e}'.format
-
-
-def get_dataset(iMETHOD, GridType, iSRC, iTGT, iVARin, Order, subPath=-1):
-    '''
-    For a given remap method, src/tgt res, variable and order, return dataset
-
-    Parameters:
-    argument1 (int): Description of arg1
-    iMETHOD (int): Parameter ranging from 0-3. 0: TempestRemap, 1: GMLS, 2: WLS-ENOR, 3: ESMF
-    GridType (int): Parameter ranging from 0-2. 0: CS-ICOD, 1: ICOD-RLL, 2: RLL-CS
-    iSRC (int): Parameter ranging from 0-4 indicating the source grid resolution in the grid combo
-    iTGT (int): Parameter ranging from 0-4 indicating the target grid resolution in the grid combo
-    iVARin (int): Parameter ranging between 0-4 indicating analytical and real sampled fields
-    Order (int): Order of the method (iMETHOD)
-    subPath (int): If a method has variations of datasets with different properties, expose through a sub-path. Default: -1 (None).
-
-    Returns:
-    pandas dataframe: The dataframe containing the metrics data in a Pandas dataframe object
-    string: The filename of the dataset that is currently loaded onto the dataframe
-
-    '''
-    assert(iMETHOD >= 0 and iMETHOD < NMETHODS)
-    assert(GridType >= 0 and GridType < NDATASETS)
-    assert(iSRC >= 0 and iSRC < 5)
-    assert(iTGT >= 0 and iTGT < 5)
-    assert(iVARin >= 0 and iVARin < 5)
-
-    filename = ""
-    if iMETHOD == 0:
-        assert(Order in TR_SUPPORTED_ORDERS)
-        TR_SUBPATH = "UniformlyRefined/TempestRemap/{0}/degree-{1}/".format(
-            GRIDTYPES[GridType], Order - 1)
-        if GridType == 0:
-            filename = MetricsFilePath + TR_SUBPATH + "metrics_CS{0}_ICOD{1}_O{2}_{3}".format(
-                CSRES[iSRC], ICODRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-        elif GridType == 1:
-            filename = MetricsFilePath + TR_SUBPATH + "metrics_ICOD{0}_RLL{1}_O{2}_{3}".format(
-                ICODRES[iSRC], RLLRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-        else:
-            filename = MetricsFilePath + TR_SUBPATH + "metrics_RLL{0}_CS{1}_O{2}_{3}".format(
-                RLLRES[iSRC], CSRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-    elif iMETHOD == 1:
-        assert(subPath in [0, 1])
-        GMLS_SUBPATHS = ['UniformlyRefined/GMLS',
-                         'UniformlyRefined/GMLS-CAAS']
-        assert(Order in GMLS_SUPPORTED_ORDERS)
-        GMLS_SUBPATH = "{0}/{1}/degree-{2}/".format(
-            GMLS_SUBPATHS[subPath], GRIDTYPES[GridType], Order - 1)
-        if GridType == 0:
-            filename = MetricsFilePath + GMLS_SUBPATH + "metrics_CS{0}_ICOD{1}_O{2}_{3}".format(
-                CSRES[iSRC], ICODRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-        elif GridType == 1:
-            filename = MetricsFilePath + GMLS_SUBPATH + "metrics_ICOD{0}_RLL{1}_O{2}_{3}".format(
-                ICODRES[iSRC], ICODRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-        else:
-            filename = MetricsFilePath + GMLS_SUBPATH + "metrics_RLL{0}_CS{1}_O{2}_{3}".format(
-                ICODRES[iSRC], CSRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-    elif iMETHOD == 2:
-        assert(Order in WLSENOR_SUPPORTED_ORDERS)
-        WLSENO_SUBPATH = "UniformlyRefined/WLS-ENOR/{0}/degree-{1}/".format(
-            GRIDTYPES[GridType], Order)
-        if GridType == 0:
-            filename = MetricsFilePath + WLSENO_SUBPATH + "metrics_CS{0}_ICOD{1}_p={2}_{3}".format(
-                CSRES[iSRC], ICODRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-        elif GridType == 1:
-            filename = MetricsFilePath + WLSENO_SUBPATH + "metrics_ICOD{0}_RLL{1}_p={2}_{3}".format(
-                ICODRES[iSRC], CSRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-        else:
-            filename = MetricsFilePath + WLSENO_SUBPATH + "metrics_RLL{0}_CS{1}_p={2}_{3}".format(
-                CSRES[iSRC], CSRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-    elif iMETHOD == 3:
-        ESMF_METHODS = ['conserve', 'conserve2nd']
-        assert(Order in ESMF_SUPPORTED_ORDERS)
-        ESMF_METHOD = ESMF_METHODS[Order - 1]
-        ESMF_SUBPATH = "UniformlyRefined/ESMF/{0}/{1}/".format(
-            GRIDTYPES[GridType], ESMF_METHOD)
-        if GridType == 0:
-            filename = MetricsFilePath + ESMF_SUBPATH + "metrics_CS{0}_ICOD{1}_{2}_{3}".format(
-                CSRES[iSRC], ICODRES[iTGT], ESMF_METHOD, DATAVARIABLES[iVARin])
-        elif GridType == 1:
-            filename = MetricsFilePath + ESMF_SUBPATH + "metrics_ICOD{0}_RLL{1}_{2}_{3}".format(
-                ICODRES[iSRC], CSRES[iTGT], ESMF_METHOD, DATAVARIABLES[iVARin])
-        else:
-            filename = MetricsFilePath + ESMF_SUBPATH + "metrics_RLL{0}_CS{1}_{2}_{3}".format(
-                CSRES[iSRC], CSRES[iTGT], ESMF_METHOD, DATAVARIABLES[iVARin])
-
-    else:
-        return None, ""
-
-    filename += '.csv'
-    compression_context = False
-    data = None
-    if not compression_context:
-        if (os.path.exists(filename + '.bz2')):
-            filename += '.bz2'
-            data = pd.read_csv(filename, compression='infer')
-        elif (os.path.exists(filename)):
-            data = pd.read_csv(filename)
-        else:
-            print('Could not find ', filename)
-    else:
-        data = pd.read_csv(filename)
+# The dataset access and analysis functions live in their own modules and are
+# re-exported here for the existing scripts and notebooks
+import MIRADatasets
+from MIRADatasets import *
+from MIRAConvergence import *
+from MIRAProfiling import stage, profile_stages
+
+# Plotting and statistics backends are imported on first use, see __getattr__
+LAZY_IMPORTS = {'plotly': ('plotly', None),
+                'px': ('plotly.express', None),
+                'go': ('plotly.graph_objs', None),
+                'tools': ('plotly', 'tools'),
+                'py': ('chart_studio.plotly', None),
+                'linregress': ('scipy.stats', 'linregress')}
+
+# Content hashes of the exported figures, by image path, kept under MetricsStorePath
+# so that exporting does not leave files in the image directories
+FIGURE_HASHES_FILE = 'figure-hashes.json'
 
-    if data is None:
-        print('Unable to get dataset. Returning...')
-    else:
-        # data.head()
-        # print("Reading filename: %s"%filename)
-        data = data.drop(data.index[0])
-
-    return data, filename
-
-
-def get_rrm_dataset(iMETHOD, iSRC, iTGT, iVARin, Order, subPath=-1):
-    '''
-    For a given remap method, src/tgt res, variable and order, return dataset
-
-    Parameters:
-    argument1 (int): Description of arg1
-    iMETHOD (int): Parameter ranging from 0-3. 0: TempestRemap, 1: GMLS, 2: WLS-ENOR, 3: ESMF
-    GridType (int): Parameter ranging from 0-2. 0: CS-ICOD, 1: ICOD-RLL, 2: RLL-CS
-    iSRC (int): Parameter ranging from 0-4 indicating the source grid resolution in the grid combo
-    iTGT (int): Parameter ranging from 0-4 indicating the target grid resolution in the grid combo
-    iVARin (int): Parameter ranging between 0-4 indicating analytical and real sampled fields
-    Order (int): Order of the method (iMETHOD)
-    subPath (int): If a method has variations of datasets with different properties, expose through a sub-path. Default: -1 (None).
-
-    Returns:
-    pandas dataframe: The dataframe containing the metrics data in a Pandas dataframe object
-    string: The filename of the dataset that is currently loaded onto the dataframe
-
-    '''
-    assert(iMETHOD >= 0 and iMETHOD < NMETHODS)
-    assert(iSRC >= 0 and iSRC < 3)
-    assert(iTGT >= 0 and iTGT < 3)
-    assert(iVARin >= 0 and iVARin < 5)
-
-    filename = ""
-    if iMETHOD == 0:
-        assert(Order in TR_SUPPORTED_ORDERS)
-        TR_SUBPATH = "RegionallyRefined/TempestRemap/degree-{0}/".format(
-            Order - 1)
-        filename = MetricsFilePath + TR_SUBPATH + "metrics_cs{0}_icodr{1}_O{2}_{3}".format(
-            CSRES[1 + iSRC], iTGT + 3, str(Order), DATAVARIABLES[iVARin])
-
-    elif iMETHOD == 1:
-        assert(subPath in [0, 1])
-        GMLS_SUBPATHS = ['RegionallyRefined/GMLS',
-                         'RegionallyRefined/GMLS-CAAS']
-        assert(Order in GMLS_SUPPORTED_ORDERS)
-        GMLS_SUBPATH = "{0}/degree-{1}/".format(
-            GMLS_SUBPATHS[subPath], Order - 1)
-        filename = MetricsFilePath + GMLS_SUBPATH + "metrics_CS{0}_ICOD{1}_O{2}_{3}".format(
-            CSRES[1 + iSRC], ICODRES[1 + iTGT], str(Order), DATAVARIABLES[iVARin])
-
-    elif iMETHOD == 2:
-        assert(Order in WLSENOR_SUPPORTED_ORDERS)
-        WLSENO_SUBPATH = "RegionallyRefined/WLS-ENOR/degree-{0}/".format(Order)
-        filename = MetricsFilePath + WLSENO_SUBPATH + "metrics_RRMr{0}_MPAS{1}_p={2}_{3}".format(
-            CSRES[iSRC], ICODRES[iTGT], str(Order), DATAVARIABLES[iVARin])
-
-    elif iMETHOD == 3:
-        ESMF_METHODS = ['conserve', 'conserve2nd']
-        assert(Order in ESMF_SUPPORTED_ORDERS)
-        ESMF_METHOD = ESMF_METHODS[Order - 1]
-        ESMF_SUBPATH = "RegionallyRefined/ESMF/{0}/".format(ESMF_METHOD)
-        filename = MetricsFilePath + ESMF_SUBPATH + "metrics_cs{0}_icodr{1}_{2}_{3}".format(
-            CSRES[1 + iSRC], iTGT + 3, ESMF_METHOD, DATAVARIABLES[iVARin])
-
-    else:
-        return None, ""
-
-    filename += '.csv'
-    compression_context = False
-    if not compression_context:
-        if (os.path.exists(filename + '.bz2')):
-            filename += '.bz2'
-            data = pd.read_csv(filename, compression='infer')
-        elif (os.path.exists(filename)):
-            data = pd.read_csv(filename)
-        else:
-            print('Could not find ', filename)
-            filename = ''
-            data = []
-    else:
-        data = pd.read_csv(filename)
+pd.options.display.float_format = '{:,.15e}'.format
 
-    data = data.drop(data.index[0])
 
-    # print("Reading filename: %s"%filename)
-    return data, filename
+def __getattr__(name):
+    if name not in LAZY_IMPORTS:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    modulename, attribute = LAZY_IMPORTS[name]
+    module = importlib.import_module(modulename)
+    value = getattr(module, attribute) if attribute else module
+    globals()[name] = value
+    return value
 
 
 def plot_dataset(
@@ -253,13 +47,21 @@ def plot_dataset(
         orders=[4, 4, 4, 2],
         isRRM=False,
         baseImagepath="images",
-        showPlot=False):
+        showPlot=False,
+        figures=None):
+
+    ##
+    # If a list is given as figures, the figures are not exported but appended
+    # to it as (filename, figure) pairs, to be exported together by export_figures
+    ##
 
     ##
     # METHODS # 0: TempestRemp, 1: GMLS, 2: WLS-ENOR, 3: ESMF
     # GRIDTYPES # 0: CS-ICOD, 1: ICOD-RLL, 2: RLL-CS
     ##
 
+    import plotly.graph_objs as go
+
     cwd = os.curdir
 
     for isrc, itgt in resolutions:
@@ -337,69 +139,70 @@ def plot_dataset(
                          'H1S': r'$H_{1,S} \texttt{ Gradient Error on Source}$'}
 
             for metricvar in metricnames:
-                fig = go.Figure()
-                fig.update_layout(
-                    margin=dict(l=20, r=20, t=20, b=20),
-                    # title_text=titledata[metricvar],
-                    # title_x=0.5,
-                    # title_xanchor='center',
-                    # title_yanchor='top',
-                    # title_font_family="Times New Roman",
-                    xaxis_title="<b>{0}</b>".format(
-                        r'$\texttt{Remap Iterations}$'),
-                    yaxis_title="<b>{0}</b>".format(yaxisdata[metricvar]),
-                    legend_title="<b>Remapping Schemes</b>",
-                    showlegend=True,
-                    # legend_y=0.5,
-                    # legend_yanchor='middle',
-                    width=800,
-                    height=500,
-                    font=dict(
-                        family="Courier New, monospace",
-                        size=14,
-                        color="#7f7f7f"
+                with stage('figure'):
+                    fig = go.Figure()
+                    fig.update_layout(
+                        margin=dict(l=20, r=20, t=20, b=20),
+                        # title_text=titledata[metricvar],
+                        # title_x=0.5,
+                        # title_xanchor='center',
+                        # title_yanchor='top',
+                        # title_font_family="Times New Roman",
+                        xaxis_title="<b>{0}</b>".format(
+                            r'$\texttt{Remap Iterations}$'),
+                        yaxis_title="<b>{0}</b>".format(yaxisdata[metricvar]),
+                        legend_title="<b>Remapping Schemes</b>",
+                        showlegend=True,
+                        # legend_y=0.5,
+                        # legend_yanchor='middle',
+                        width=800,
+                        height=500,
+                        font=dict(
+                            family="Courier New, monospace",
+                            size=14,
+                            color="#7f7f7f"
+                        )
+                        #      yaxis_type="log"
                     )
-                    #      yaxis_type="log"
-                )
-
-                print('Computing plots for ', titledata[metricvar])
-
-                def transformvar(metricvec):
-                    # if metricvar in ['GC', 'GL1', 'GL2', 'GLinf', 'H12T',
-                    # 'H1T', 'H12S', 'H1S', 'LMaxL1', 'LMaxL2', 'LML1',
-                    # 'LMinL2']:
-                    if metricvar in ['GC', 'GL1', 'GL2',
-                                     'GLinf', 'H12T', 'H1T', 'H12S', 'H1S']:
-                        return np.log10(np.abs(metricvec))
-                    elif metricvar in ['LMaxL1', 'LMaxL2', 'LMaxLm', 'LMinL1', 'LMinL2', 'LMinLm']:
-                        return (metricvec)
-                    else:
-                        return metricvec
-
-                fig.add_trace(
-                    go.Scatter(
-                        x=REMAPITERATIONS, y=transformvar(dfTR[metricvar]),
-                        mode='lines+markers', name="<b>{0}(p={1})</b>".format(METHODS[0],
-                                                                              orders[0] - 1)))
-                fig.add_trace(
-                    go.Scatter(
-                        x=REMAPITERATIONS, y=transformvar(
-                            dfGMLSCAAS[metricvar]),
-                        mode='lines+markers', name="<b>{0}-CAAS(p={1})</b>".format(METHODS[1],
-                                                                                   orders[1])))
-                fig.add_trace(
-                    go.Scatter(
-                        x=REMAPITERATIONS, y=transformvar(dfWLSENO[metricvar]),
-                        mode='lines+markers', name="<b>{0}(p={1})</b>".format(METHODS[2],
-                                                                              orders[2])))
-                # fig.add_trace( go.Scatter(x=REMAPITERATIONS,
-                # y=transformvar(dfWLSENOC[metricvar]), mode='lines+markers',
-                # name="<b>{0}-C({1})</b>".format(METHODS[2],orders[2]))) #,
-                # row=1, col=1)
-                fig.add_trace(
-                    go.Scatter(
-                        x=REMAPITERATIONS, y=transformvar(dfESMF[metricvar]),
-                        mode='lines+markers', name="<b>{0}(conserve2nd)</b>".format(METHODS[3])))  # , row=1, col=1)
+
+                    print('Computing plots for ', titledata[metricvar])
+
+                    def transformvar(metricvec):
+                        # if metricvar in ['GC', 'GL1', 'GL2', 'GLinf', 'H12T',
+                        # 'H1T', 'H12S', 'H1S', 'LMaxL1', 'LMaxL2', 'LML1',
+                        # 'LMinL2']:
+                        if metricvar in ['GC', 'GL1', 'GL2',
+                                         'GLinf', 'H12T', 'H1T', 'H12S', 'H1S']:
+                            return np.log10(np.abs(metricvec))
+                        elif metricvar in ['LMaxL1', 'LMaxL2', 'LMaxLm', 'LMinL1', 'LMinL2', 'LMinLm']:
+                            return (metricvec)
+                        else:
+                            return metricvec
+
+                    fig.add_trace(
+                        go.Scatter(
+                            x=REMAPITERATIONS, y=transformvar(dfTR[metricvar]),
+                            mode='lines+markers', name="<b>{0}(p={1})</b>".format(METHODS[0],
+                                                                                  orders[0] - 1)))
+                    fig.add_trace(
+                        go.Scatter(
+                            x=REMAPITERATIONS, y=transformvar(
+                                dfGMLSCAAS[metricvar]),
+                            mode='lines+markers', name="<b>{0}-CAAS(p={1})</b>".format(METHODS[1],
+                                                                                       orders[1])))
+                    fig.add_trace(
+                        go.Scatter(
+                            x=REMAPITERATIONS, y=transformvar(dfWLSENO[metricvar]),
+                            mode='lines+markers', name="<b>{0}(p={1})</b>".format(METHODS[2],
+                                                                                  orders[2])))
+                    # fig.add_trace( go.Scatter(x=REMAPITERATIONS,
+                    # y=transformvar(dfWLSENOC[metricvar]), mode='lines+markers',
+                    # name="<b>{0}-C({1})</b>".format(METHODS[2],orders[2]))) #,
+                    # row=1, col=1)
+                    fig.add_trace(
+                        go.Scatter(
+                            x=REMAPITERATIONS, y=transformvar(dfESMF[metricvar]),
+                            mode='lines+markers', name="<b>{0}(conserve2nd)</b>".format(METHODS[3])))  # , row=1, col=1)
 
                 if showPlot:
                     fig.show()
@@ -415,34 +218,138 @@ def plot_dataset(
                             baseImagepath,
                             metricvar, DATAVARIABLES[ivar],
                             isrc, itgt)
-                    print("Saving file: {0}/{1}".format(cwd, sfilename))
-                    fig.write_image(sfilename)
+                    if figures is not None:
+                        figures.append((sfilename, fig))
+                    else:
+                        print("Saving file: {0}/{1}".format(cwd, sfilename))
+                        with stage('write_image') as timer:
+                            fig.write_image(sfilename)
+                            timer.nbytes = os.path.getsize(sfilename)
+
+
+def _write_figure_image(job):
+    '''
+    Worker for export_figures: render a figure given as JSON to an image file
+    '''
+    import plotly.io
+
+    sfilename, figjson = job
+    with stage('write_image') as timer:
+        plotly.io.from_json(figjson).write_image(sfilename)
+        timer.nbytes = os.path.getsize(sfilename)
+    return sfilename
+
+
+def export_figures(figures, nprocs=None, force=False):
+    '''
+    Export many figures to image files across worker processes, skipping the
+    figures whose image is already current. A figure is current when its image
+    exists and the hash of the figure content (metric data, labels and layout)
+    matches the one recorded for its path in FIGURE_HASHES_FILE under MetricsStorePath.
+
+    Parameters:
+    figures (list): (filename, figure) pairs, e.g. collected by plot_dataset(figures=...)
+    nprocs (int): Number of worker processes. Default: os.cpu_count()
+    force (bool): Re-render all figures regardless of their recorded hashes
+
+    Returns:
+    list: The filenames of the images that were (re-)rendered
+
+    '''
+    hashfile = os.path.join(MIRADatasets.MetricsStorePath, FIGURE_HASHES_FILE)
+    hashes = {}
+    if os.path.exists(hashfile):
+        with open(hashfile, 'r') as fhashes:
+            hashes = json.load(fhashes)
+    jobs = []
+    for sfilename, fig in figures:
+        with stage('figure_json') as timer:
+            figjson = fig.to_json()
+            timer.nbytes = len(figjson)
+        fighash = hashlib.sha256(figjson.encode('utf-8')).hexdigest()
+        name = os.path.abspath(sfilename)
+        if not force and os.path.exists(sfilename) and hashes.get(name) == fighash:
+            continue
+        hashes[name] = fighash
+        jobs.append((sfilename, figjson))
+
+    print('Rendering {0} of {1} figures'.format(len(jobs), len(figures)))
+    if nprocs is None:
+        nprocs = os.cpu_count() or 1
+    if nprocs <= 1 or len(jobs) <= 1:
+        rendered = [_write_figure_image(job) for job in jobs]
+    else:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=nprocs) as executor:
+            rendered = list(executor.map(_write_figure_image, jobs))
+
+    # Only record the hashes once the images have been written
+    if jobs:
+        os.makedirs(MIRADatasets.MetricsStorePath, exist_ok=True)
+        with open(hashfile + '.tmp', 'w') as fhashes:
+            json.dump(hashes, fhashes, indent=1, sort_keys=True)
+        os.replace(hashfile + '.tmp', hashfile)
+    return rendered
 
 
 def main():
+    figures = []
 
     # Uniform mesh plots for the paper
     plot_dataset(ivar=4, metricnames=['GC'], resolutions=[(0, 4), (4, 0), (4, 4)],
-                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False)
+                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False, figures=figures)
     plot_dataset(ivar=2, metricnames=['GMaxE'], resolutions=[(0, 4), (4, 0), (4, 4)],
-                 gridtypes=[1], orders=[4, 4, 4, 2], showPlot=False)
+                 gridtypes=[1], orders=[4, 4, 4, 2], showPlot=False, figures=figures)
     plot_dataset(ivar=3, metricnames=['GMinE'], resolutions=[(0, 4), (4, 0), (4, 4)],
-                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False)
+                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False, figures=figures)
     plot_dataset(ivar=4, metricnames=['LMaxL2'], resolutions=[(0, 4), (4, 0), (4, 4)],
-                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False)
+                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False, figures=figures)
     plot_dataset(ivar=3, metricnames=['LMinL2'], resolutions=[(0, 4), (4, 0), (4, 4)],
-                 gridtypes=[2], orders=[4, 4, 4, 2], showPlot=False)
+                 gridtypes=[2], orders=[4, 4, 4, 2], showPlot=False, figures=figures)
 
     # RRM plots for the paper
     plot_dataset(ivar=3, metricnames=['GC'], resolutions=[(0, 2), (2, 0), (2, 2)], isRRM=True,
-                 orders=[4, 4, 4, 2], showPlot=False)
+                 orders=[4, 4, 4, 2], showPlot=False, figures=figures)
     plot_dataset(ivar=2, metricnames=['GMaxE'], resolutions=[(0, 2), (2, 0), (2, 2)], isRRM=True,
-                 orders=[4, 4, 4, 2], showPlot=False)
+                 orders=[4, 4, 4, 2], showPlot=False, figures=figures)
     plot_dataset(ivar=3, metricnames=['LMaxL2'], resolutions=[(2, 2)], isRRM=True,
-                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False)
+                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False, figures=figures)
     plot_dataset(ivar=3, metricnames=['LMinL2'], resolutions=[(2, 2)], isRRM=True,
-                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False)
+                 gridtypes=[0], orders=[4, 4, 4, 2], showPlot=False, figures=figures)
+
+    # Render the figures whose data or plot parameters changed
+    export_figures(figures)
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Compare the MIRA metrics datasets for different remapping algorithms')
+    parser.add_argument('--scan-catalog', action='store_true',
+                        help='Rescan {0} and rewrite the catalog of available datasets'.format(MIRADatasets.MetricsFilePath))
+    parser.add_argument('--convergence', metavar='CSVFILE',
+                        help='Write the observed and nominal convergence orders of all uniformly refined cases to CSVFILE')
+    parser.add_argument('--build-store', action='store_true',
+                        help='Pack all metrics datasets into the consolidated store at {0}'.format(MIRADatasets.MetricsStorePath))
+    parser.add_argument('--report', metavar='HTMLFILE',
+                        help='Write an interactive report of all metrics datasets to HTMLFILE')
+    parser.add_argument('--profile', metavar='STATSFILE',
+                        help='Print the time spent in each pipeline stage and write cProfile statistics to STATSFILE')
+    args = parser.parse_args()
+
+    with profile_stages(cprofile=bool(args.profile)) as profile:
+        if args.scan_catalog:
+            print('Found {0} metrics datasets'.format(len(get_metrics_catalog(rescan=True))))
+        if args.build_store:
+            build_metrics_store()
+        if args.convergence:
+            compute_convergence_rates().to_csv(args.convergence, index=False)
+        if args.report:
+            from MIRAReport import write_report
+            write_report(args.report)
+        if not (args.scan_catalog or args.build_store or args.convergence or args.report):
+            main()
+
+    if args.profile:
+        print(profile.summary())
+        profile.dump_stats(args.profile)
@@ -0,0 +1,37 @@
+'''
+Fixtures shared by the tests of the MIRA scripts.
+'''
+import os
+
+import pandas as pd
+import pytest
+
+import MIRADatasets
+from MIRADatasets import METRICSNAMES
+
+
+def write_metrics_file(root, relpath, values):
+    filename = os.path.join(root, relpath)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    pd.DataFrame(values, columns=METRICSNAMES).to_csv(filename, index=False)
+
+
+@pytest.fixture
+def metrics_paths(tmp_path, monkeypatch):
+    '''
+    Point MIRADatasets at empty dataset and store directories, restoring the
+    paths and the opened catalog, store and caches afterwards
+    '''
+    datapath = str(tmp_path / 'MetricsData') + os.sep
+    storepath = str(tmp_path / 'MetricsStore') + os.sep
+    os.makedirs(datapath)
+    monkeypatch.setattr(MIRADatasets, 'MetricsFilePath', datapath)
+    monkeypatch.setattr(MIRADatasets, 'MetricsStorePath', storepath)
+    monkeypatch.setattr(MIRADatasets, 'USE_METRICS_STORE', True)
+    monkeypatch.setattr(MIRADatasets, 'USE_DECOMPRESSED_CACHE', True)
+    for name in ['_metricsCatalog', '_metricsStore', '_metricsCatalogSource', '_metricsStoreSource',
+                 '_compactArchive', '_frameCache']:
+        monkeypatch.setattr(MIRADatasets, name, getattr(MIRADatasets, name))
+    MIRADatasets.configure_frame_cache()
+    MIRADatasets.set_compact_archive(None)
+    return datapath, storepath
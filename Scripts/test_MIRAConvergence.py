@@ -0,0 +1,56 @@
+'''
+Tests of the convergence order fits of MIRAConvergence.
+'''
+import numpy as np
+
+from conftest import write_metrics_file
+from MIRADatasets import METRICSNAMES, REMAPITERATIONS, CSRES, ICODRES, GRIDTYPES
+from MIRAConvergence import fit_power_law, get_grid_spacings, get_nominal_order, compute_convergence_rates
+
+
+def test_fit_power_law():
+    h = np.array([0.4, 0.2, 0.1, 0.05, 0.025])
+    errors = np.array([3.0 * h**2, -0.5 * h**4.5, [1.0, np.nan, 0.0, np.inf, 1e-3]])
+    order, intercept, residual, npoints = fit_power_law(h, errors)
+    np.testing.assert_allclose(order[:2], [2.0, 4.5])
+    np.testing.assert_allclose(intercept[:2], np.log10([3.0, 0.5]))
+    np.testing.assert_allclose(residual[:2], 0.0, atol=1e-12)
+    # Zero and non-finite errors are left out of the fit
+    assert npoints.tolist() == [5, 5, 2]
+    np.testing.assert_allclose(order[2], 3.0 / np.log10(0.4 / 0.025))
+
+    order = fit_power_law(h, [[1.0, np.nan, 0.0, np.nan, np.nan]])[0]
+    assert np.isnan(order).all()
+
+
+def test_nominal_order():
+    assert get_nominal_order('TempestRemap', '', 4) == 4
+    assert get_nominal_order('GMLS', 'CAAS', 3) == 3
+    assert get_nominal_order('WLS-ENOR', '', 2) == 3
+    assert get_nominal_order('ESMF', 'conserve', 1) == 1
+    assert get_nominal_order('ESMF', 'conserve2nd', 2) == 2
+    assert get_nominal_order('ESMF', 'bilinear', 2) == 2
+
+
+def test_compute_convergence_rates(metrics_paths):
+    datapath, storepath = metrics_paths
+    hsrc, htgt = get_grid_spacings(GRIDTYPES.index('CS-MPAS'))
+    h = np.maximum(hsrc, htgt)
+    # WLS-ENOR p=2 converging at third order, one order below for GMLS O3
+    for ires in range(len(CSRES)):
+        resolution = 'CS{0}_ICOD{1}'.format(CSRES[ires], ICODRES[ires])
+        values = np.ones((len(REMAPITERATIONS), len(METRICSNAMES)))
+        values[:, METRICSNAMES.index('GL2')] = 2.0 * h[ires]**3
+        write_metrics_file(datapath, 'UniformlyRefined/WLS-ENOR/CS-MPAS/degree-2/metrics_{0}_p=2_Topography.csv'.format(
+            resolution), values)
+        values[:, METRICSNAMES.index('GL2')] = 2.0 * h[ires]**2
+        write_metrics_file(datapath, 'UniformlyRefined/GMLS/CS-MPAS/degree-2/metrics_{0}_O3_Topography.csv'.format(
+            resolution), values)
+
+    table = compute_convergence_rates(metrics=['GL2'], methods=[(1, 0), (2, -1)], gridtypes=[0], nprocs=1)
+    assert len(table) == 2 * len(REMAPITERATIONS)
+    final = table[table['iteration'] == REMAPITERATIONS[-1]].set_index('method')
+    np.testing.assert_allclose(final['observed_order'], [2.0, 3.0])
+    assert final['nominal_order'].tolist() == [3, 3]
+    np.testing.assert_allclose(final['order_difference'], [-1.0, 0.0], atol=1e-12)
+    assert (final['npoints'] == len(CSRES)).all()
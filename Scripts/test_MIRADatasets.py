@@ -0,0 +1,278 @@
+'''
+Tests of the compact archive codec, the dataset filename parser, the
+segmented metrics store and the dataset cache of MIRADatasets.
+
+Usage:
+cd Scripts
+python -m pytest -q
+'''
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import MIRADatasets
+from conftest import write_metrics_file
+from MIRADatasets import (METRICSNAMES, REMAPITERATIONS, COMPACT_ENCODINGS, COMPACT_RELATIVE_ERROR,
+                          CompactArchive, FrameCache, get_relative_errors, parse_metrics_filename)
+
+NITERATIONS = len(REMAPITERATIONS)
+NMETRICS = len(METRICSNAMES)
+
+
+def make_key(icase):
+    return ('TempestRemap', '', 'CS-MPAS', icase, icase, 'Topography', 4)
+
+
+def make_values(seed, ncases=3):
+    '''
+    Return metrics of shape (ncases, iterations, metrics) mixing slowly varying
+    series with zeros, NaN, infinities, subnormals and values beyond float32
+    '''
+    rng = np.random.default_rng(seed)
+    values = rng.standard_normal((ncases, 1, NMETRICS)) * np.cumprod(
+        1.0 + 1e-3 * rng.standard_normal((ncases, NITERATIONS, NMETRICS)), axis=1)
+    values[:, :, 1] = 0.0
+    values[:, 5:9, 2] = np.nan
+    values[:, 10, 3] = np.inf
+    values[:, 11, 3] = -np.inf
+    values[:, :, 4] = 1e-44 * (1.0 + np.arange(NITERATIONS))
+    values[:, 20, 5] = 1e305
+    values[:, 21, 5] = -3e-320
+    values[:, 30:, 6] = 1e39
+    return values
+
+
+@pytest.mark.parametrize('encoding', COMPACT_ENCODINGS)
+def test_compact_archive_round_trip(encoding):
+    values = make_values(0)
+    keys = [make_key(icase) for icase in range(len(values))]
+    archive = CompactArchive(encoding)
+    archive.append(keys, values, ['case{0}.csv'.format(icase) for icase in range(len(values))])
+
+    assert len(archive) == len(keys)
+    decoded = archive.take(keys)
+    errors = get_relative_errors(decoded, values)
+    assert errors.max() <= COMPACT_RELATIVE_ERROR
+    assert archive.max_relative_error <= COMPACT_RELATIVE_ERROR
+
+    # Zeros, NaN and infinities are exact
+    np.testing.assert_array_equal(decoded[:, :, 1], 0.0)
+    assert np.isnan(decoded[:, 5:9, 2]).all()
+    np.testing.assert_array_equal(decoded[:, 10:12, 3], [[np.inf, -np.inf]] * len(keys))
+
+    data, filename = archive.get(keys[1])
+    assert list(data.columns) == METRICSNAMES
+    assert filename == 'case1.csv'
+    np.testing.assert_array_equal(data.to_numpy(), decoded[1])
+    assert archive.get(make_key(9)) == (None, "")
+
+
+@pytest.mark.parametrize('encoding', COMPACT_ENCODINGS)
+def test_compact_archive_exceptions(encoding):
+    values = make_values(1)
+    keys = [make_key(icase) for icase in range(len(values))]
+    archive = CompactArchive(encoding)
+    archive.append(keys, values)
+
+    # Deep float32 subnormals and out-of-range values exceed the error bound and are kept exactly
+    for row, key in enumerate(keys):
+        index, exceptional = archive.exceptions[key]
+        flat = values[row].ravel()
+        np.testing.assert_array_equal(flat[index], exceptional)
+        decoded = archive.decode(key)
+        np.testing.assert_array_equal(decoded[:, 4], values[row, :, 4])
+        np.testing.assert_array_equal(decoded[20:22, 5], values[row, 20:22, 5])
+        np.testing.assert_array_equal(decoded[30:, 6], values[row, 30:, 6])
+
+    # Cases that float32 holds within the bound have no exceptions
+    archive.append([make_key(9)], np.ones((1, NITERATIONS, NMETRICS)) / 3.0)
+    assert make_key(9) not in archive.exceptions
+
+
+@pytest.mark.parametrize('encoding', COMPACT_ENCODINGS)
+def test_compact_archive_discard_and_replace(encoding):
+    values = make_values(2)
+    keys = [make_key(icase) for icase in range(len(values))]
+    archive = CompactArchive(encoding)
+    archive.append(keys, values)
+
+    # A replaced case drops its stale exceptions and decodes to the new values
+    replacement = np.full((1, NITERATIONS, NMETRICS), 0.25)
+    archive.append(keys[:1], replacement, ['new.csv'])
+    assert len(archive) == len(keys)
+    assert keys[0] not in archive.exceptions
+    np.testing.assert_array_equal(archive.decode(keys[0]), replacement[0])
+    assert archive.get(keys[0])[1] == 'new.csv'
+    assert get_relative_errors(archive.decode(keys[1]), values[1]).max() <= COMPACT_RELATIVE_ERROR
+
+    archive.discard(keys[1:2])
+    assert keys[1] not in archive
+    assert archive.decode(keys[1]) is None
+    assert keys[1] not in archive.exceptions
+    assert archive.keys == [keys[0], keys[2]]
+
+
+@pytest.mark.parametrize('relpath, key', [
+    ('UniformlyRefined/TempestRemap/MPAS-RLL/degree-0/metrics_ICOD256_RLL180-360_O1_AnalyticalFun1.csv',
+     ('TempestRemap', '', 'MPAS-RLL', 4, 2, 'AnalyticalFun1', 1)),
+    ('UniformlyRefined/TempestRemap/RLL-CS/degree-3/metrics_RLL30-60_CS16_O4_Topography.csv',
+     ('TempestRemap', '', 'RLL-CS', 0, 0, 'Topography', 4)),
+    ('UniformlyRefined/GMLS/CS-MPAS/degree-3/metrics_CS16_ICOD16_O4_AnalyticalFun1.csv.bz2',
+     ('GMLS', '', 'CS-MPAS', 0, 0, 'AnalyticalFun1', 4)),
+    ('UniformlyRefined/GMLS-CAAS/CS-MPAS/degree-1/metrics_CS16_ICOD16_O2_AnalyticalFun1.csv.bz2',
+     ('GMLS', 'CAAS', 'CS-MPAS', 0, 0, 'AnalyticalFun1', 2)),
+    ('UniformlyRefined/WLS-ENOR/RLL-CS/degree-4/metrics_RLL16_CS16_p=4_AnalyticalFun1.csv',
+     ('WLS-ENOR', '', 'RLL-CS', 0, 0, 'AnalyticalFun1', 4)),
+    ('UniformlyRefined/ESMF/CS-MPAS/conserve/metrics_CS16_ICOD16_conserve_AnalyticalFun1.csv',
+     ('ESMF', 'conserve', 'CS-MPAS', 0, 0, 'AnalyticalFun1', 1)),
+    ('UniformlyRefined/ESMF/RLL-CS/conserve2nd/metrics_RLL16_CS16_conserve2nd_AnalyticalFun1.csv',
+     ('ESMF', 'conserve2nd', 'RLL-CS', 0, 0, 'AnalyticalFun1', 2)),
+    ('RegionallyRefined/TempestRemap/degree-0/metrics_cs32_icodr3_O1_AnalyticalFun1.csv',
+     ('TempestRemap', '', 'RRM', 0, 0, 'AnalyticalFun1', 1)),
+    ('RegionallyRefined/GMLS/degree-3/metrics_CS32_ICOD32_O4_AnalyticalFun1.csv',
+     ('GMLS', '', 'RRM', 0, 0, 'AnalyticalFun1', 4)),
+    ('RegionallyRefined/WLS-ENOR/degree-2/metrics_RRMr16_MPAS16_p=2_AnalyticalFun1.csv',
+     ('WLS-ENOR', '', 'RRM', 0, 0, 'AnalyticalFun1', 2)),
+    ('RegionallyRefined/ESMF/conserve/metrics_cs128_icodr4_conserve_TotalPrecipWater.csv',
+     ('ESMF', 'conserve', 'RRM', 2, 1, 'TotalPrecipWater', 1)),
+])
+def test_parse_metrics_filename(relpath, key):
+    assert parse_metrics_filename(relpath) == key
+    assert parse_metrics_filename(relpath.replace('/', os.sep)) == key
+
+
+@pytest.mark.parametrize('relpath', [
+    'UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS16_ICOD16_O4_Topography.txt',
+    'UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS16_ICOD16_O4_Elevation.csv',
+    'UniformlyRefined/TempestRemap/CS-RLL/degree-3/metrics_CS16_ICOD16_O4_Topography.csv',
+    'UniformlyRefined/Unknown/CS-MPAS/degree-3/metrics_CS16_ICOD16_O4_Topography.csv',
+    'UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS17_ICOD16_O4_Topography.csv',
+    'UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS16_ICOD16_bilinear_Topography.csv',
+    'RegionallyRefined/TempestRemap/metrics_cs32_icodr3_O1_Topography.csv',
+])
+def test_parse_metrics_filename_rejects(relpath):
+    assert parse_metrics_filename(relpath) is None
+
+
+def test_frame_cache_eviction():
+    frames = [pd.DataFrame(np.full((NITERATIONS, NMETRICS), float(icase)), columns=METRICSNAMES)
+              for icase in range(4)]
+    nbytes = int(frames[0].memory_usage(index=True).sum())
+
+    # The least recently used entry is evicted beyond maxentries
+    cache = FrameCache(maxentries=2, maxbytes=10 * nbytes)
+    cache.put(make_key(0), frames[0], 'file0')
+    cache.put(make_key(1), frames[1], 'file1')
+    assert cache.get(make_key(0))[1] == 'file0'
+    cache.put(make_key(2), frames[2], 'file2')
+    assert list(cache.entries) == [make_key(0), make_key(2)]
+    assert cache.get(make_key(1)) == (None, "")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # ... and beyond maxbytes, and frames larger than maxbytes are not cached
+    cache = FrameCache(maxentries=10, maxbytes=2 * nbytes)
+    for icase in range(3):
+        cache.put(make_key(icase), frames[icase], 'file{0}'.format(icase))
+    assert list(cache.entries) == [make_key(1), make_key(2)]
+    assert cache.nbytes == 2 * nbytes
+    cache.put(make_key(3), pd.concat(frames[:3]), 'file3')
+    assert list(cache.entries) == [make_key(1), make_key(2)]
+    cache.put(make_key(1), frames[3], 'file3')
+    assert list(cache.entries) == [make_key(2), make_key(1)]
+    assert cache.nbytes == 2 * nbytes
+
+    # Cached frames are copies
+    data, filename = cache.get(make_key(2))
+    data.iloc[:, :] = -1.0
+    frames[2].iloc[:, :] = -1.0
+    np.testing.assert_array_equal(cache.get(make_key(2))[0].to_numpy(), 2.0)
+
+    # maxentries=0 disables the cache
+    cache = FrameCache(maxentries=0)
+    cache.put(make_key(0), frames[0], 'file0')
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_store_segments_override(metrics_paths):
+    datapath, storepath = metrics_paths
+    relpaths = ['UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS16_ICOD16_O4_Topography.csv',
+                'UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS32_ICOD32_O4_Topography.csv']
+    keys = [parse_metrics_filename(relpath) for relpath in relpaths]
+    original = [np.full((NITERATIONS, NMETRICS), 1.0 + ifile) for ifile in range(len(relpaths))]
+    for relpath, values in zip(relpaths, original):
+        write_metrics_file(datapath, relpath, values)
+    store = MIRADatasets.build_metrics_store()
+    assert len(store) == len(keys)
+
+    # Each appended segment overrides the stored copies of its cases
+    updates = [np.full((NITERATIONS, NMETRICS), 10.0), np.full((NITERATIONS, NMETRICS), 20.0)]
+    for values in updates:
+        write_metrics_file(datapath, relpaths[0], values)
+        MIRADatasets.update_metrics_catalog(relpaths[:1])
+        MIRADatasets.append_metrics_store(keys[:1])
+
+    for store in [MIRADatasets.get_metrics_store(), MIRADatasets.MetricsStore(storepath)]:
+        assert len(store) == len(keys)
+        assert len(store.segments) == 1 + len(updates)
+        np.testing.assert_array_equal(store.get(keys[0])[0].to_numpy(), updates[-1])
+        np.testing.assert_array_equal(store.get(keys[1])[0].to_numpy(), original[1])
+        np.testing.assert_array_equal(store.take([store.rows[key] for key in keys]), [updates[-1], original[1]])
+    np.testing.assert_array_equal(MIRADatasets.load_dataset(keys[0])[0].to_numpy(), updates[-1])
+
+    # Rebuilding compacts the segments and keeps the latest values
+    store = MIRADatasets.build_metrics_store()
+    assert len(store.segments) == 1
+    assert not [filename for filename in os.listdir(storepath)
+                if filename.startswith(MIRADatasets.METRICSSTORE_SEGMENT_PREFIX)]
+    np.testing.assert_array_equal(store.get(keys[0])[0].to_numpy(), updates[-1])
+
+
+def test_load_many_spawned_workers(metrics_paths, tmp_path, monkeypatch):
+    import bz2
+    import functools
+    import multiprocessing
+    import concurrent.futures
+
+    datapath, storepath = metrics_paths
+    relpaths = ['UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS{0}_ICOD16_O4_Topography.csv'.format(res)
+                for res in MIRADatasets.CSRES]
+    for ifile, relpath in enumerate(relpaths):
+        write_metrics_file(datapath, relpath, np.full((NITERATIONS, NMETRICS), float(ifile)))
+    with open(os.path.join(datapath, relpaths[0]), 'rb') as fmetrics:
+        compressed = bz2.compress(fmetrics.read())
+    os.remove(os.path.join(datapath, relpaths[0]))
+    with open(os.path.join(datapath, relpaths[0] + '.bz2'), 'wb') as fmetrics:
+        fmetrics.write(compressed)
+
+    # Spawned workers start from a fresh import of MIRADatasets in another directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', functools.partial(
+        concurrent.futures.ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn')))
+    cases = [(0, 0, isrc, 0, MIRADatasets.DATAVARIABLES.index('Topography'), 4, -1)
+             for isrc in range(len(relpaths))]
+    data = MIRADatasets.load_many(cases, nprocs=2, chunksize=2)
+
+    assert MIRADatasets.get_metrics_store() is None
+    assert len(data) == len(relpaths) * NITERATIONS
+    np.testing.assert_array_equal(data['GC'].groupby(level='src').first().to_numpy(), np.arange(len(relpaths)))
+    assert os.listdir(os.path.join(storepath, MIRADatasets.DECOMPRESSED_CACHE_DIRECTORY))
+
+
+def test_set_metrics_paths(metrics_paths, tmp_path):
+    datapath, storepath = metrics_paths
+    relpath = 'UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS16_ICOD16_O4_Topography.csv'
+    write_metrics_file(datapath, relpath, np.full((NITERATIONS, NMETRICS), 1.0))
+    assert len(MIRADatasets.get_metrics_catalog()) == 1
+
+    # The catalog of the previous directories is dropped on the next use
+    MIRADatasets.set_metrics_paths(str(tmp_path / 'OtherData'), str(tmp_path / 'OtherStore'))
+    assert MIRADatasets.MetricsFilePath == str(tmp_path / 'OtherData') + os.sep
+    assert MIRADatasets.MetricsStorePath == str(tmp_path / 'OtherStore') + os.sep
+    os.makedirs(MIRADatasets.MetricsFilePath)
+    assert len(MIRADatasets.get_metrics_catalog()) == 0
+
+    MIRADatasets.set_metrics_paths(datapath)
+    assert len(MIRADatasets.get_metrics_catalog()) == 1
+    assert MIRADatasets.MetricsStorePath == str(tmp_path / 'OtherStore') + os.sep
@@ -0,0 +1,57 @@
+'''
+Tests of the incremental ingestion of new metrics datasets with MIRAIngest.
+'''
+import os
+
+import numpy as np
+import pytest
+
+import MIRADatasets
+from conftest import write_metrics_file
+from MIRADatasets import METRICSNAMES, REMAPITERATIONS, DATAVARIABLES
+from MIRAIngest import find_new_metrics_files, validate_metrics_files, ingest_metrics_files
+
+SHAPE = (len(REMAPITERATIONS), len(METRICSNAMES))
+IVAR = DATAVARIABLES.index('Topography')
+
+
+def test_ingest_new_order(metrics_paths):
+    datapath, storepath = metrics_paths
+    existing = 'UniformlyRefined/WLS-ENOR/CS-MPAS/degree-4/metrics_CS16_ICOD16_p=4_Topography.csv'
+    write_metrics_file(datapath, existing, np.full(SHAPE, 4.0))
+    MIRADatasets.build_metrics_store()
+
+    # A WLS-ENOR order that is not in SUPPORTED_ORDERS, and an invalid file
+    neworder = 'UniformlyRefined/WLS-ENOR/CS-MPAS/degree-5/metrics_CS16_ICOD16_p=5_Topography.csv'
+    truncated = 'UniformlyRefined/WLS-ENOR/CS-MPAS/degree-5/metrics_CS32_ICOD32_p=5_Topography.csv'
+    write_metrics_file(datapath, neworder, np.full(SHAPE, 5.0))
+    write_metrics_file(datapath, truncated, np.full((10, len(METRICSNAMES)), 5.0))
+
+    relpaths = find_new_metrics_files()
+    assert sorted(relpaths) == sorted([neworder, truncated])
+    valid, invalid = validate_metrics_files(relpaths)
+    assert valid == [neworder]
+    assert list(invalid) == [truncated]
+
+    keys = ingest_metrics_files(valid)
+    assert keys == [('WLS-ENOR', '', 'CS-MPAS', 0, 0, 'Topography', 5)]
+    assert keys[0] in MIRADatasets.get_metrics_store()
+    assert find_new_metrics_files() == [truncated]
+
+    assert 5 not in MIRADatasets.SUPPORTED_ORDERS[2]
+    assert MIRADatasets.get_supported_orders(2) == [2, 3, 4, 5]
+    data, filename = MIRADatasets.get_dataset(2, 0, 0, 0, IVAR, 5)
+    np.testing.assert_array_equal(data.to_numpy(), np.full(SHAPE, 5.0))
+    assert filename == datapath + neworder
+    assert (2, 0, 0, 0, IVAR, 5, -1) in MIRADatasets.build_sweep(methods=[(2, -1)])
+
+
+def test_get_dataset_rejects_unknown_arguments(metrics_paths):
+    with pytest.raises(ValueError, match='Order 7 is not available for WLS-ENOR'):
+        MIRADatasets.get_dataset(2, 0, 0, 0, IVAR, 7)
+    with pytest.raises(ValueError, match='iSRC'):
+        MIRADatasets.get_rrm_dataset(0, 3, 0, IVAR, 4)
+    with pytest.raises(ValueError, match='subPath'):
+        MIRADatasets.get_dataset(1, 0, 0, 0, IVAR, 4)
+    with pytest.raises(ValueError, match='No ESMF method of order 3'):
+        MIRADatasets.get_dataset_key(3, 0, 0, 0, IVAR, 3)
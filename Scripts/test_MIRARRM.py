@@ -0,0 +1,13 @@
+'''
+Tests of the grouping of the RRM cases with their uniform counterparts in MIRARRM.
+'''
+from MIRARRM import RRM_GROUP, get_rrm_group
+
+
+def test_get_rrm_group():
+    rrm = ('GMLS', 'CAAS', 'RRM', 1, 2, 'AnalyticalFun1', 4)
+    uniform = ('GMLS', 'CAAS', 'CS-MPAS', 3, 0, 'AnalyticalFun1', 4)
+    assert get_rrm_group(rrm) == ('GMLS', 'CAAS', 'AnalyticalFun1', 4)
+    assert get_rrm_group(uniform) == get_rrm_group(rrm)
+    assert get_rrm_group(rrm[:-1] + (3,)) != get_rrm_group(rrm)
+    assert len(get_rrm_group(rrm)) == len(RRM_GROUP)
@@ -0,0 +1,37 @@
+'''
+Tests of the single-file HTML report of MIRAReport.
+'''
+import json
+import zlib
+import base64
+
+import numpy as np
+
+from conftest import write_metrics_file
+from MIRADatasets import METRICSNAMES, REMAPITERATIONS
+from MIRAReport import write_report
+
+
+def test_write_report(metrics_paths, tmp_path):
+    datapath, storepath = metrics_paths
+    relpath = 'UniformlyRefined/TempestRemap/CS-MPAS/degree-3/metrics_CS16_ICOD16_O4_Topography.csv'
+    values = np.arange(len(REMAPITERATIONS) * len(METRICSNAMES), dtype=np.float64).reshape(
+        len(REMAPITERATIONS), len(METRICSNAMES))
+    write_metrics_file(datapath, relpath, values)
+
+    filename = str(tmp_path / 'report.html')
+    title = '</title><script>alert("x")</script> & co'
+    assert write_report(filename, metrics=['GL2', 'GMaxE'], title=title) == 1
+    with open(filename, encoding='utf-8') as freport:
+        html = freport.read()
+    assert '<script>alert' not in html
+    assert html.count('&lt;/title&gt;&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt; &amp; co') == 2
+
+    index = json.loads(html.split('<script id="report-index" type="application/json">')[1].split('</script>')[0])
+    assert index['dimensions']['method'] == ['TempestRemap']
+    assert index['metrics'] == ['GL2', 'GMaxE']
+    encoded = html.split('<script id="report-data" type="application/octet-stream">')[1].split('</script>')[0]
+    shuffled = np.frombuffer(zlib.decompress(base64.b64decode(encoded)), dtype=np.uint8)
+    series = shuffled.reshape(4, -1).T.copy().view('<f4').reshape(1, 2, len(REMAPITERATIONS))
+    columns = [METRICSNAMES.index('GL2'), METRICSNAMES.index('GMaxE')]
+    np.testing.assert_array_equal(series[0], values[:, columns].T.astype(np.float32))
@@ -0,0 +1,64 @@
+'''
+Tests of the query parsing and HTTP handling of MIRAService.
+'''
+import json
+import asyncio
+
+import numpy as np
+
+from MIRADatasets import METRICSNAMES, REMAPITERATIONS
+from MIRAService import MetricsService, ResidentArchive, parse_criteria, parse_query
+
+KEYS = [('GMLS', '', 'CS-MPAS', 0, 4, 'Topography', 3),
+        ('GMLS', 'CAAS', 'CS-MPAS', 0, 4, 'Topography', 3),
+        ('TempestRemap', '', 'CS-MPAS', 0, 4, 'Topography', 3)]
+
+
+def make_archive():
+    values = np.arange(len(KEYS), dtype=np.float64)[:, None, None] * np.ones(
+        (len(KEYS), len(REMAPITERATIONS), len(METRICSNAMES)))
+    values[0, -1, 0] = np.nan
+    return ResidentArchive(KEYS, values)
+
+
+def request(service, requestline):
+    '''
+    Send one request to the service over a local connection and return the status and the body
+    '''
+    async def exchange():
+        server = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(requestline + b'\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        header, _, body = response.partition(b'\r\n\r\n')
+        return int(header.split()[1]), body
+
+    return asyncio.run(exchange())
+
+
+def test_parse_criteria():
+    assert parse_criteria(parse_query('method=GMLS,TempestRemap&order=3&src=')) == {
+        'method': ['GMLS', 'TempestRemap'], 'order': [3]}
+    assert parse_criteria(parse_query('subtype=&method=GMLS')) == {'method': ['GMLS'], 'subtype': ['']}
+    assert parse_criteria(parse_query('subtype=CAAS')) == {'subtype': ['CAAS']}
+
+
+def test_slice_blank_subtype_selects_plain_variations():
+    status, body = request(MetricsService(make_archive()), b'GET /slice?subtype=&method=GMLS&iteration=final HTTP/1.1')
+    assert status == 200
+    table = json.loads(body)
+    rows = [dict(zip(table['columns'], row)) for row in table['data']]
+    assert [(row['method'], row['subtype']) for row in rows] == [('GMLS', '')]
+    assert rows[0]['GC'] is None
+
+
+def test_bad_requests():
+    service = MetricsService(make_archive())
+    assert request(service, b'GARBAGE')[0] == 400
+    assert request(service, b'GET /slice?order=third HTTP/1.1')[0] == 400
+    assert request(service, b'GET /unknown HTTP/1.1')[0] == 404
+    assert request(service, b'POST /slice HTTP/1.1')[0] == 405
+    assert service.errors == 4
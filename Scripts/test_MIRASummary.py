@@ -0,0 +1,61 @@
+'''
+Tests of the per-case summaries and bounds violations of MIRASummary.
+'''
+import os
+import glob
+
+import numpy as np
+import pytest
+
+from MIRADatasets import METRICSNAMES, REMAPITERATIONS, parse_metrics_filename, read_metrics_file
+from MIRASummary import BOUNDS_TOLERANCE, summarize_values
+
+METRICSDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MetricsData')
+IMAX, IMIN = METRICSNAMES.index('GMaxE'), METRICSNAMES.index('GMinE')
+
+
+def make_bounds_values(gmaxe, gmine):
+    values = np.full((len(gmaxe), len(REMAPITERATIONS), len(METRICSNAMES)), 1e-3)
+    for case, (maxerror, minerror) in enumerate(zip(gmaxe, gmine)):
+        values[case, :, IMAX] = maxerror
+        values[case, :, IMIN] = minerror
+    return values
+
+
+def test_diffusive_cases_do_not_violate_bounds():
+    # Monotone schemes lose the global extrema: GMaxE and GMinE grow from zero
+    diffusion = np.linspace(0.0, 0.9995, len(REMAPITERATIONS))
+    keys = [('ESMF', 'conserve', 'CS-MPAS', 0, 4, 'Topography', 1),
+            ('GMLS', 'CAAS', 'RLL-CS', 2, 2, 'AnalyticalFun1', 4)]
+    bounds = summarize_values(keys, make_bounds_values([diffusion, diffusion], [diffusion, 0.0]))[1]
+    assert bounds['violations'].tolist() == [0, 0]
+    assert bounds['first_violation'].tolist() == [-1, -1]
+    assert bounds['max_overshoot'].tolist() == [0.0, 0.0]
+    assert bounds['max_undershoot'].tolist() == [0.0, 0.0]
+
+
+def test_new_extrema_violate_bounds():
+    overshoot = np.zeros(len(REMAPITERATIONS))
+    overshoot[10:] = -0.05
+    undershoot = np.zeros(len(REMAPITERATIONS))
+    undershoot[3] = -10 * BOUNDS_TOLERANCE
+    keys = [('TempestRemap', '', 'CS-MPAS', 0, 0, 'Topography', 4),
+            ('WLS-ENOR', '', 'CS-MPAS', 0, 0, 'Topography', 4)]
+    bounds = summarize_values(keys, make_bounds_values([overshoot, 0.0], [0.0, undershoot]))[1]
+    assert bounds['violations'].tolist() == [len(REMAPITERATIONS) - 10, 1]
+    assert bounds['first_violation'].tolist() == [REMAPITERATIONS[10], REMAPITERATIONS[3]]
+    assert bounds['max_overshoot'].tolist() == [0.05, 0.0]
+    assert bounds['max_undershoot'].tolist() == [0.0, -10 * BOUNDS_TOLERANCE]
+
+
+@pytest.mark.skipif(not os.path.isdir(METRICSDATA), reason='MetricsData is not available')
+def test_esmf_conserve_preserves_bounds():
+    relpaths = sorted(os.path.relpath(filename, METRICSDATA) for filename in
+                      glob.glob(os.path.join(METRICSDATA, '*', 'ESMF', '**', 'conserve', 'metrics_*.csv'),
+                                recursive=True))
+    assert relpaths
+    keys = [parse_metrics_filename(relpath) for relpath in relpaths]
+    values = np.array([read_metrics_file(os.path.join(METRICSDATA, relpath)).to_numpy() for relpath in relpaths])
+    bounds = summarize_values(keys, values)[1]
+    assert (bounds['violations'] == 0).all()
+    assert (bounds['max_overshoot'] == 0.0).all()
@@ -0,0 +1,47 @@
+'''
+Tests of the figure export of ROOComparison.
+'''
+import os
+
+import MIRADatasets
+import ROOComparison
+from ROOComparison import FIGURE_HASHES_FILE, export_figures
+
+
+def make_figure(values):
+    import plotly.graph_objs as go
+    return go.Figure(go.Scatter(x=list(range(len(values))), y=values))
+
+
+def test_export_figures_skips_unchanged(metrics_paths, tmp_path, monkeypatch):
+    datapath, storepath = metrics_paths
+    imagepath = tmp_path / 'images'
+    imagepath.mkdir()
+
+    def write_image(job):
+        sfilename, figjson = job
+        with open(sfilename, 'w') as fimage:
+            fimage.write(figjson)
+        return sfilename
+
+    monkeypatch.setattr(ROOComparison, '_write_figure_image', write_image)
+    figures = [(str(imagepath / 'a.png'), make_figure([1, 2, 3])),
+               (str(imagepath / 'b.png'), make_figure([4, 5, 6]))]
+    assert export_figures(figures, nprocs=1) == [figures[0][0], figures[1][0]]
+    assert export_figures(figures, nprocs=1) == []
+
+    # Changed figures, deleted images and forced exports are rendered again
+    figures[1] = (figures[1][0], make_figure([4, 5, 7]))
+    assert export_figures(figures, nprocs=1) == [figures[1][0]]
+    os.remove(figures[0][0])
+    assert export_figures(figures, nprocs=1) == [figures[0][0]]
+    assert export_figures(figures, nprocs=1, force=True) == [figures[0][0], figures[1][0]]
+
+    # The hashes are kept with the store, not next to the images
+    assert sorted(os.listdir(imagepath)) == ['a.png', 'b.png']
+    assert os.path.exists(os.path.join(storepath, FIGURE_HASHES_FILE))
+
+
+def test_settings_are_not_forwarded():
+    assert ROOComparison.set_metrics_paths is MIRADatasets.set_metrics_paths
+    assert not hasattr(ROOComparison, 'MetricsFilePath')